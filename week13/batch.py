@@ -0,0 +1,210 @@
+'''
+Batch simulator for balancing the cannon game.
+
+Plays thousands of seeded headless games in a process pool, for every
+combination of the swept Manager parameters, with a scripted or aiming cannon,
+and prints a summary of the score table statistics. With --npc-aimer the NPC
+aims by Monte-Carlo lookahead instead of the ballistic solver.
+
+    python batch.py --games 2000 --ticks 900 \
+        --sweep bomb_chance=0.005,0.02 --sweep gravity=1,2,3 --policy greedy
+    python batch.py --games 200 --policy greedy --npc-aimer 5
+
+Work is sent to the workers in chunks of seeds and each game comes back as a
+small tuple of numbers, so almost no time goes to inter-process communication.
+'''
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import itertools
+import math
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cannon
+
+PARAMETERS = {
+    "num_of_targets": int,
+    "gravity": int,
+    "bomb_chance": float,
+    "max_radius": int,
+    "shrink": float,
+}
+
+
+class IdlePolicy:
+    '''
+    Never shoots. Shows what the bombs alone do to the score.
+    '''
+    def __call__(self, mgr, tick):
+        return cannon.Action()
+
+
+class ScriptedPolicy:
+    '''
+    Shoots every 30 ticks at a random point after charging for a random time.
+    '''
+    def __init__(self):
+        self.aim = None
+        self.release = -1
+
+    def __call__(self, mgr, tick):
+        if tick % 30 == 0:
+            self.aim = (random.randint(0, cannon.SCREEN_SIZE[0]), random.randint(0, cannon.SCREEN_SIZE[1] // 2))
+            self.release = tick + random.randint(1, 20)
+            return cannon.Action(aim=self.aim, charge=True)
+        return cannon.Action(aim=self.aim, fire=tick == self.release)
+
+
+class GreedyPolicy:
+    '''
+    Aims straight at the closest target, charging longer for farther ones.
+    '''
+    def __init__(self):
+        self.release = -1
+
+    def __call__(self, mgr, tick):
+        if len(mgr.targets) == 0:
+            return cannon.Action()
+        gun = mgr.gun.coord
+        coord = mgr.targets.coord[:len(mgr.targets)]
+        aim = tuple(coord[((coord - gun)**2).sum(axis=1).argmin()].tolist())
+        if tick % 30 == 0:
+            distance = math.hypot(aim[0] - gun[0], aim[1] - gun[1])
+            self.release = tick + min(25, int(distance / 25))
+            return cannon.Action(aim=aim, charge=True)
+        return cannon.Action(aim=aim, fire=tick == self.release)
+
+
+POLICIES = {
+    "idle": IdlePolicy,
+    "scripted": ScriptedPolicy,
+    "greedy": GreedyPolicy,
+}
+
+
+def play(seed, params, ticks, policy, npc_aimer=None):
+    '''
+    Plays one seeded headless game, with a fresh instance of the policy class,
+    and returns its result record:
+    (seed, score, targets destroyed, shells used, hits taken).
+    With npc_aimer, the NPC's lookahead gets that many milliseconds per shot.
+    '''
+    random.seed(seed)
+    mgr = cannon.Manager(seed=seed, **params)
+    if npc_aimer is not None:
+        mgr.npc_aimer = cannon.MonteCarloAimer(budget_ms=npc_aimer, seed=seed)
+    # the NPC's aiming tables, built once per worker process before the first tick
+    cannon.ballistic_solver(mgr.gravity)
+    policy = policy()
+    for tick in range(ticks):
+        mgr.step(policy(mgr, tick))
+    table = mgr.score_table
+    return (seed, table.score(), table.target_destroyed, table.shell_used, table.hit)
+
+
+def play_chunk(params, seeds, ticks, policy_name, npc_aimer=None):
+    '''
+    Worker task: plays a chunk of games with the same parameters.
+    '''
+    return [play(seed, params, ticks, POLICIES[policy_name], npc_aimer) for seed in seeds]
+
+
+def parse_sweep(specs):
+    '''
+    Turns ["gravity=1,2", "bomb_chance=0.01"] into the list of all parameter combinations.
+    '''
+    names, values = [], []
+    for spec in specs:
+        name, _, options = spec.partition("=")
+        if name not in PARAMETERS:
+            raise ValueError("unknown parameter {!r}, expected one of {}".format(name, ", ".join(PARAMETERS)))
+        names.append(name)
+        values.append([PARAMETERS[name](option) for option in options.split(",")])
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def run(sweep, games, ticks, policy_name, workers=None, chunk_size=50, base_seed=0, npc_aimer=None):
+    '''
+    Plays `games` games for every parameter combination in the sweep.
+    Returns {index of the combination: list of result records}.
+    '''
+    results = {i: [] for i in range(len(sweep))}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for i, params in enumerate(sweep):
+            for start in range(0, games, chunk_size):
+                seeds = range(base_seed + start, base_seed + min(games, start + chunk_size))
+                futures[pool.submit(play_chunk, params, seeds, ticks, policy_name, npc_aimer)] = i
+        for future, i in futures.items():
+            results[i].extend(future.result())
+    return results
+
+
+def summarize(sweep, results):
+    '''
+    Returns one summary row per parameter combination.
+    '''
+    rows = []
+    for i, params in enumerate(sweep):
+        records = results[i]
+        scores = [record[1] for record in records]
+        destroyed = sum(record[2] for record in records)
+        shells = sum(record[3] for record in records)
+        scores_sorted = sorted(scores)
+        rows.append({
+            "params": " ".join("{}={}".format(name, value) for name, value in params.items()) or "defaults",
+            "games": len(records),
+            "mean": statistics.fmean(scores),
+            "stdev": statistics.pstdev(scores),
+            "p5": scores_sorted[len(scores_sorted) * 5 // 100],
+            "p95": scores_sorted[min(len(scores_sorted) - 1, len(scores_sorted) * 95 // 100)],
+            "destroyed": destroyed / len(records),
+            "accuracy": destroyed / shells if shells else 0.0,
+            "hits": sum(record[4] for record in records) / len(records),
+        })
+    return rows
+
+
+def print_summary(rows):
+    header = "{:<40} {:>6} {:>9} {:>8} {:>6} {:>6} {:>10} {:>9} {:>8}"
+    print(header.format("parameters", "games", "mean", "stdev", "p5", "p95", "destroyed", "accuracy", "hits"))
+    for row in rows:
+        print(header.format(row["params"], row["games"], "{:.2f}".format(row["mean"]), "{:.2f}".format(row["stdev"]),
+                            row["p5"], row["p95"], "{:.2f}".format(row["destroyed"]),
+                            "{:.3f}".format(row["accuracy"]), "{:.2f}".format(row["hits"])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=1000, help="games per parameter combination")
+    parser.add_argument("--ticks", type=int, default=900, help="ticks per game (30 per second of play)")
+    parser.add_argument("--sweep", action="append", default=[],
+                        help="name=value1,value2,... for one of: " + ", ".join(PARAMETERS))
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="scripted")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, all cores by default")
+    parser.add_argument("--chunk", type=int, default=50, help="games per worker task")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--npc-aimer", metavar="MS", type=float, default=None,
+                        help="NPC aims by lookahead simulation with this time budget per shot")
+    args = parser.parse_args(argv)
+
+    sweep = parse_sweep(args.sweep)
+    start = time.perf_counter()
+    results = run(sweep, args.games, args.ticks, args.policy, args.workers, args.chunk, args.seed, args.npc_aimer)
+    elapsed = time.perf_counter() - start
+
+    print_summary(summarize(sweep, results))
+    total = args.games * len(sweep)
+    print("{} games, {:.1f} s, {:.1f} games/s, {:.0f} ticks/s".format(
+        total, elapsed, total / elapsed, total * args.ticks / elapsed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
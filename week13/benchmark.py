@@ -0,0 +1,286 @@
+'''
+Benchmark suite for the cannon game loop.
+
+Runs the real Manager headlessly (SDL dummy video driver) with scripted input
+and reports, for every scene, nanoseconds per tick for each phase of
+Manager.process, ticks per second and peak memory. A scene has a number of
+shells, targets and bombs, by default the same scene size for all three. The
+screen stays 800x600, so above DENSE_ENTITIES entities in all the radii,
+speeds and gravity shrink with the square root of the count. The area the
+entities cover, and with it the number of colliding pairs per entity, then
+stays that of a scene of DENSE_ENTITIES instead of growing with the count.
+Results can be saved as a
+JSON baseline and later runs are compared against it. It also times a cold
+`import cannon` and the first Manager.step() in fresh interpreters, which must
+stay under STARTUP_BUDGET_MS and must not load pygame, so tools and worker
+processes that only need the physics start fast.
+
+    python benchmark.py                          # run and compare with the baseline
+    python benchmark.py --sizes 10,1000,100000   # custom scene sizes
+    python benchmark.py --sizes 1000,100000 --targets 30 --bombs 10
+    python benchmark.py --save                   # store the results as the new baseline
+'''
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pygame as pg
+
+import cannon
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+PHASES = ["handle_events", "move", "collide", "draw", "bomb_process", "new_mission"]
+# entities a scene holds at full size, bigger scenes get smaller and slower entities
+DENSE_ENTITIES = 300
+STARTUP_BUDGET_MS = 100
+STARTUP_SCRIPT = '''
+import sys, time
+start = time.perf_counter()
+import cannon
+cannon.Manager(seed=0).step(cannon.Action(charge=True, fire=True))
+print((time.perf_counter() - start) * 1e3, type(sys.modules["pygame"]) is type(sys))
+'''
+
+
+def scripted_events(tick):
+    '''
+    Player input for a tick: sweeps the aim, charges every 10 ticks and fires 5 ticks later,
+    switching the shell type once in a while.
+    '''
+    events = [pg.event.Event(pg.MOUSEMOTION, pos=(tick * 7 % cannon.SCREEN_SIZE[0], 100), rel=(0, 0), buttons=(0, 0, 0))]
+    if tick % 10 == 0:
+        events.append(pg.event.Event(pg.MOUSEBUTTONDOWN, button=1, pos=(0, 0)))
+    if tick % 10 == 5:
+        events.append(pg.event.Event(pg.MOUSEBUTTONUP, button=1, pos=(0, 0)))
+    if tick % 50 == 49:
+        events.append(pg.event.Event(pg.KEYDOWN, key=pg.K_SPACE, mod=0, unicode=" ", scancode=0))
+    return events
+
+
+def entity_scale(shells, targets, bombs):
+    '''
+    Factor for radii and speeds that keeps a scene as dense as one of DENSE_ENTITIES entities.
+    :shells, targets, bombs
+    '''
+    return min(1.0, (DENSE_ENTITIES / max(1, shells + targets + bombs)) ** 0.5)
+
+
+def populate(mgr, shells, targets, bombs):
+    '''
+    Fills the manager with the requested number of random shells, targets and bombs,
+    scaled by entity_scale. Gravity is scaled too, or falling shells would soon sweep
+    across many small neighbours in a tick.
+    :mgr, shells, targets, bombs
+    '''
+    width, height = cannon.SCREEN_SIZE
+    scale = entity_scale(shells, targets, bombs)
+    mgr.gravity *= scale
+    mgr.shells.clear()
+    mgr.targets.clear()
+    mgr.bombs.clear()
+    for _ in range(shells):
+        shell_type = random.choice(mgr.shell_types)
+        shell = shell_type([random.randint(50, width - 50), random.randint(50, height - 50)],
+                           [round(random.randint(-30, 30) * scale), round(random.randint(-30, 30) * scale)])
+        shell.radius = max(1, round(shell.radius * scale))
+        mgr.shells.append(shell)
+    target_types = [cannon.Target, cannon.MovingTargets, cannon.CircularTargets]
+    for i in range(targets):
+        target = target_types[i % 3](radius=max(1, round(random.randint(5, 30) * scale)))
+        if isinstance(target, cannon.MovingTargets):
+            target.x_velocity, target.y_velocity = round(target.x_velocity * scale), round(target.y_velocity * scale)
+        elif isinstance(target, cannon.CircularTargets):
+            target.circular_radius = max(1, round(target.circular_radius * scale))
+        mgr.targets.append(target)
+    for _ in range(bombs):
+        mgr.bombs.append(cannon.Bomb([random.randint(10, width - 10), random.randint(0, height)],
+                                     radius=max(1, round(10 * scale)), gravity=2 * scale))
+
+
+def scene_name(shells, targets, bombs):
+    return "{}/{}/{}".format(shells, targets, bombs)
+
+
+def run_scene(shells, targets, bombs, ticks, seed=0):
+    '''
+    Runs one scene of shells, targets and bombs for `ticks` ticks, timing each phase.
+    Returns a result record with ns/tick per phase, ticks/sec and peak memory.
+    :shells, targets, bombs, ticks, seed
+    '''
+    screen = pg.display.get_surface()
+    random.seed(seed)
+    mgr = cannon.Manager(num_of_targets=1, seed=seed)
+    populate(mgr, shells, targets, bombs)
+    # the NPC's aiming tables are built once per process, keep that out of the per-tick numbers
+    cannon.ballistic_solver(mgr.gravity)
+
+    phase_ns = dict.fromkeys(PHASES, 0)
+    clock = time.perf_counter_ns
+    for tick in range(ticks):
+        events = scripted_events(tick)
+
+        start = clock()
+        action = mgr.handle_events(events)
+        action.aim = events[0].pos
+        mgr.apply_action(action)
+        t_events = clock()
+        mgr.move()
+        t_move = clock()
+        mgr.collide()
+        t_collide = clock()
+        mgr.draw(screen)
+        t_draw = clock()
+        mgr.bomb_process()
+        t_bombs = clock()
+        mgr.check_mission()
+        t_mission = clock()
+
+        phase_ns["handle_events"] += t_events - start
+        phase_ns["move"] += t_move - t_events
+        phase_ns["collide"] += t_collide - t_move
+        phase_ns["draw"] += t_draw - t_collide
+        phase_ns["bomb_process"] += t_bombs - t_draw
+        phase_ns["new_mission"] += t_mission - t_bombs
+
+    phase_ns = {name: total // ticks for name, total in phase_ns.items()}
+    frame_ns = sum(phase_ns.values())
+    step_ns = frame_ns - phase_ns["draw"]
+
+    # memory is measured in a separate, shorter pass since tracing slows everything down
+    random.seed(seed)
+    tracemalloc.start()
+    mgr = cannon.Manager(num_of_targets=1, seed=seed)
+    populate(mgr, shells, targets, bombs)
+    for tick in range(min(ticks, 5)):
+        mgr.process(scripted_events(tick), screen)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "scene": scene_name(shells, targets, bombs),
+        "scale": entity_scale(shells, targets, bombs),
+        "ticks": ticks,
+        "phase_ns": phase_ns,
+        "frame_ns": frame_ns,
+        "ticks_per_sec": 1e9 / frame_ns if frame_ns else float("inf"),
+        "headless_ticks_per_sec": 1e9 / step_ns if step_ns else float("inf"),
+        "peak_memory_kb": peak // 1024,
+    }
+
+
+def measure_startup(runs=5):
+    '''
+    Times `import cannon` and one headless tick in `runs` fresh interpreters, after one run that
+    writes the bytecode cache. Returns the median in milliseconds and whether pygame got loaded.
+    :runs
+    '''
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    for _ in range(runs + 1):
+        out = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=cwd, env=env, check=True,
+                             capture_output=True, text=True).stdout.split()
+        timings.append(float(out[-2]))
+    return statistics.median(timings[1:]), out[-1] == "True"
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Compares frame and phase times with the baseline. Returns list of regression messages.
+    :results, baseline, tolerance
+    '''
+    regressions = []
+    old_by_scene = {record.get("scene"): record for record in baseline.get("results", [])}
+    for record in results:
+        old = old_by_scene.get(record["scene"])
+        if old is None:
+            continue
+        for name in PHASES + ["frame"]:
+            new_ns = record["frame_ns"] if name == "frame" else record["phase_ns"][name]
+            old_ns = old["frame_ns"] if name == "frame" else old["phase_ns"].get(name, 0)
+            # sub-microsecond phases are dominated by timer noise
+            if old_ns > 1000 and new_ns > old_ns * tolerance:
+                regressions.append("scene {}: {} {:.0f} ns -> {:.0f} ns ({:.2f}x)".format(
+                    record["scene"], name, old_ns, new_ns, new_ns / old_ns))
+    return regressions
+
+
+def print_table(results):
+    header = "{:>20} {:>6} " + "{:>14} " * len(PHASES) + "{:>12} {:>12} {:>10}"
+    print(header.format("shells/targets/bombs", "scale", *PHASES, "ticks/s", "headless/s", "peak KB"))
+    for record in results:
+        print(header.format(record["scene"], "{:.2f}".format(record["scale"]),
+                            *[record["phase_ns"][name] for name in PHASES],
+                            "{:.1f}".format(record["ticks_per_sec"]),
+                            "{:.1f}".format(record["headless_ticks_per_sec"]),
+                            record["peak_memory_kb"]))
+
+
+def main(argv=None):
+    '''
+    Runs the benchmark suite from the command line.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,10000",
+                        help="comma separated scene sizes, the count of shells, targets and bombs not given below")
+    parser.add_argument("--shells", type=int, default=None, help="shells in every scene instead of the size")
+    parser.add_argument("--targets", type=int, default=None, help="targets in every scene instead of the size")
+    parser.add_argument("--bombs", type=int, default=None, help="bombs in every scene instead of the size")
+    parser.add_argument("--ticks", type=int, default=50, help="ticks per scene (fewer are used for big scenes)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="save results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="slowdown ratio reported as regression")
+    parser.add_argument("--startup-runs", type=int, default=5, help="interpreters timing the import, 0 to skip")
+    args = parser.parse_args(argv)
+
+    startup = []
+    if args.startup_runs > 0:
+        import_ms, loads_pygame = measure_startup(args.startup_runs)
+        print("cold import and first step: {:.1f} ms (budget {} ms){}".format(
+            import_ms, STARTUP_BUDGET_MS, ", loads pygame" if loads_pygame else ""))
+        if import_ms > STARTUP_BUDGET_MS:
+            startup.append("cold import and first step {:.1f} ms over the {} ms budget".format(
+                import_ms, STARTUP_BUDGET_MS))
+        if loads_pygame:
+            startup.append("headless step loads pygame")
+
+    pg.display.init()
+    pg.font.init()
+    pg.display.set_mode(cannon.SCREEN_SIZE)
+
+    results = []
+    for size in [int(size) for size in args.sizes.split(",")]:
+        counts = [size if count is None else count for count in (args.shells, args.targets, args.bombs)]
+        ticks = max(3, min(args.ticks, args.ticks * 1000 // max(1, *counts)))
+        results.append(run_scene(*counts, ticks))
+    print_table(results)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+        print("baseline saved to", args.baseline)
+        return 0
+
+    regressions = list(startup)
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions += compare(results, json.load(f), args.tolerance)
+    else:
+        print("no baseline at", args.baseline)
+    for message in regressions:
+        print("REGRESSION", message)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,46 @@
 import numpy as np
-import pygame as pg
+import copy
+import importlib.util
 import math
-from random import randint, random
+import sys
+import threading
+from collections import OrderedDict, deque
+import random
+from time import perf_counter, perf_counter_ns, sleep
 
-pg.init()
-pg.font.init()
+
+class MissingModule:
+    '''
+    Stands in for a module that isn't installed. Raises the import error on first attribute
+    access, so code that never uses the module runs without it.
+    '''
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        raise ModuleNotFoundError("No module named '{}'".format(self.name), name=self.name)
+
+
+def lazy_import(name):
+    '''
+    Returns the module, imported on first attribute access. Importing pygame takes longer
+    than the rest of the game, and the physics never needs it, so headless games also run
+    where it isn't installed.
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return MissingModule(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+# nothing is initialized here: the window starts video, hud_text starts the font module
+pg = lazy_import("pygame")
 
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
@@ -15,10 +51,19 @@ BLUE = (0, 0, 255)
 SCREEN_SIZE = (800, 600)
 
 
-def rand_color():
-    return (randint(0, 255), randint(0, 255), randint(0, 255))
+def rand_color(rng=random):
+    return (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
+
+def lerp(previous, current, alpha):
+    '''
+    Position between previous (alpha 0) and current (alpha 1) one. Works on lists and arrays.
+    '''
+    if isinstance(current, np.ndarray):
+        return previous + (current - previous) * alpha
+    return [p + (c - p) * alpha for p, c in zip(previous, current)]
 
 class GameObject:
+    __slots__ = ()
 
     def move(self):
         pass
@@ -26,6 +71,19 @@ class GameObject:
     def draw(self, screen):
         pass  
 
+    def copy(self):
+        '''
+        Shallow copy with its own coordinate and velocity lists, so moving one doesn't move the other.
+        :self
+        '''
+        clone = copy.copy(self)
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                value = getattr(clone, name, None)
+                if isinstance(value, list):
+                    setattr(clone, name, list(value))
+        return clone
+
 
 
 class Bomb(GameObject):
@@ -33,17 +91,18 @@ class Bomb(GameObject):
     The bomb class, drops straight down
     :GameObject
     """
-    def __init__(self, coord, velocity=None, radius=10, gravity=2):
+    __slots__ = ('coord', 'velocity', 'radius', 'gravity')
+    def __init__(self, coord, velocity=None, radius=10, gravity=2, rng=random):
         """
         Constructor Method. Initializes bomb's parameters and initial values.
-        :self, coord, velocity, radius, gravity
+        Random values are drawn from rng, the global random module by default.
+        :self, coord, velocity, radius, gravity, rng
         """
-        self.rect = None
         self.coord = coord
         self.radius = radius
         self.gravity = 2
         if velocity is None:
-            self.velocity = [randint(-2, 2), randint(-1, 2)]
+            self.velocity = [rng.randint(-2, 2), rng.randint(-1, 2)]
         else:
             self.velocity = velocity
 
@@ -58,20 +117,31 @@ class Bomb(GameObject):
         Draws bomb on screen
         :self, screen
         """
-        self.rect = pg.draw.circle(screen, BLACK, self.coord, self.radius)
+        pg.draw.circle(screen, BLACK, self.coord, self.radius)
+
+    def get_rect(self):
+        '''
+        Bounding rectangle of the bomb, computed from its coordinate so no drawing is needed.
+        :self
+        '''
+        return pg.Rect(self.coord[0]-self.radius, self.coord[1]-self.radius,
+                       2*self.radius, 2*self.radius)
     
     def check_collision(self, tank_rect):
         '''
         Checks whether the bombs bumps into tank
         :self, tank_rect
         '''
-        return self.rect.colliderect(tank_rect) if self.rect is not None else False
+        return self.get_rect().colliderect(tank_rect)
 
 class Shell(GameObject):
     '''
     The shell class. Creates a shell, controls its movement and implement its rendering.
     :GameObject
     '''
+    __slots__ = ('coord', 'velocity', 'color', 'radius', 'is_alive', 'is_fired', 'rect')
+    gravity_multiplier = 1
+
     def __init__(self, coord, velocity, radius=20, color=None):
         '''
         Constructor method. Initializes shell's parameters and initial values.
@@ -130,6 +200,9 @@ class PowerfulShell(Shell):
     :Shell
 
     """
+    __slots__ = ('alive_max', 'alive_timer')
+    gravity_multiplier = 0
+
     def __init__(self, coord, velocity, radius=20, color=None, alive_max=10):
         '''
         Constructor method. Initializes shell's parameters and initial values.
@@ -157,6 +230,9 @@ class BigShell(Shell):
     Big Shell but high gravity
     :Shell
     """
+    __slots__ = ('alive_max', 'alive_timer')
+    gravity_multiplier = 2
+
     def __init__(self, coord, velocity, radius=50, color=None, alive_max=10):
         '''
         Constructor method. Initializes shell's parameters and initial values.
@@ -180,11 +256,644 @@ class BigShell(Shell):
         if self.alive_timer > self.alive_max:
             self.is_alive = False
 
+class ArrayStore:
+    '''
+    Struct-of-arrays storage. Every field is a contiguous NumPy array, rows [0, len) are live.
+    Subclasses list their fields in `fields` as name: (dtype, per-row shape).
+    Stores with a 'uid' field number their rows as they are added. Rows keep their order,
+    so uids of the live rows are always ascending. With `removed` set to a list, the uids
+    of removed rows are collected in it, e.g. to send them to network clients.
+    '''
+    fields = {}
+
+    def __init__(self, capacity=64):
+        '''
+        Constructor method. Allocates every field with the given capacity.
+        :self, capacity
+        '''
+        self.size = 0
+        self.capacity = capacity
+        self.next_uid = 0
+        self.removed = None
+        for name, (dtype, shape) in self.fields.items():
+            setattr(self, name, np.zeros((capacity,) + shape, dtype=dtype))
+
+    def __len__(self):
+        return self.size
+
+    def reserve(self, count):
+        '''
+        Makes room for count more rows, at least doubling the capacity when full.
+        :self, count
+        '''
+        if self.size + count > self.capacity:
+            self.capacity = max(2 * self.capacity, self.size + count)
+            for name in self.fields:
+                old = getattr(self, name)
+                new = np.zeros((self.capacity,) + old.shape[1:], dtype=old.dtype)
+                new[:self.size] = old[:self.size]
+                setattr(self, name, new)
+
+    def push(self):
+        '''
+        Reserves a new row at the end. Returns row's index.
+        :self
+        '''
+        self.reserve(1)
+        self.size += 1
+        self.number(self.size - 1, self.size)
+        return self.size - 1
+
+    def number(self, start, stop):
+        '''
+        Gives rows [start, stop) the next unique ids, in stores that have a uid field.
+        :self, start, stop
+        '''
+        if 'uid' in self.fields:
+            self.uid[start:stop] = np.arange(self.next_uid, self.next_uid + stop - start)
+            self.next_uid += stop - start
+
+    def cull(self, keep):
+        '''
+        Compacts the store, keeping only rows where the boolean mask `keep` is set.
+        Order of the remaining rows is preserved.
+        :self, keep
+        '''
+        index = np.flatnonzero(keep)
+        kept = len(index)
+        if kept == self.size:
+            return
+        if self.removed is not None:
+            self.removed.append(self.uid[:self.size][~np.asarray(keep, dtype=np.bool_)])
+        # rows before the first removed one are already in place
+        moved = np.flatnonzero(index != np.arange(kept))
+        first = int(moved[0]) if len(moved) else kept
+        for name in self.fields:
+            arr = getattr(self, name)
+            arr[first:kept] = arr[index[first:]]
+        self.size = kept
+
+    def clear(self):
+        if self.removed is not None:
+            self.removed.append(self.uid[:self.size].copy())
+        self.size = 0
+
+    def copy(self):
+        '''
+        Copy of the live rows only. Removed rows of the original aren't tracked in the copy.
+        :self
+        '''
+        clone = type(self)(max(self.size, 8))
+        clone.size = self.size
+        clone.next_uid = self.next_uid
+        for name in self.fields:
+            getattr(clone, name)[:self.size] = getattr(self, name)[:self.size]
+        return clone
+
+
+class ShellStore(ArrayStore):
+    '''
+    Live shells of all three types, moved and checked as batch operations.
+    Behaves as Shell, PowerfulShell and BigShell move methods applied to every row.
+    '''
+    fields = {
+        'coord': (np.float64, (2,)),
+        'prev_coord': (np.float64, (2,)), # coordinate before the last move, for interpolation
+        'velocity': (np.float64, (2,)),
+        'radius': (np.float64, ()),
+        'color': (np.uint8, (3,)),
+        'gravity_multiplier': (np.float64, ()),
+        'alive_timer': (np.int64, ()),
+        'alive_max': (np.int64, ()), # -1 for shells that live until they stop
+        'is_fired': (np.bool_, ()),
+        'tag': (np.int64, ()), # free for callers to tell shells apart, e.g. aiming candidates
+        'uid': (np.int64, ()),
+    }
+
+    prototypes = {} # one shell object per type, where add takes the radius and lifetime from
+
+    def add(self, shell_type, coord, velocity, color):
+        '''
+        Writes a new shell of the given type straight into a new row, no shell object is created.
+        Returns row's index.
+        :self, shell_type, coord, velocity, color
+        '''
+        shell = self.prototypes.get(shell_type)
+        if shell is None:
+            shell = self.prototypes[shell_type] = shell_type([0, 0], [0, 0], color=BLACK)
+        i = self.push()
+        self.coord[i] = coord
+        self.prev_coord[i] = coord
+        self.velocity[i] = velocity
+        self.radius[i] = shell.radius
+        self.color[i] = color
+        self.gravity_multiplier[i] = shell.gravity_multiplier
+        self.alive_timer[i] = getattr(shell, 'alive_timer', 0)
+        self.alive_max[i] = getattr(shell, 'alive_max', -1)
+        self.is_fired[i] = False
+        self.tag[i] = 0
+        return i
+
+    def append(self, shell):
+        '''
+        Copies a shell object into the store.
+        :self, shell
+        '''
+        i = self.push()
+        self.coord[i] = shell.coord
+        self.prev_coord[i] = shell.coord
+        self.velocity[i] = shell.velocity
+        self.radius[i] = shell.radius
+        self.color[i] = shell.color
+        self.gravity_multiplier[i] = shell.gravity_multiplier
+        self.alive_timer[i] = getattr(shell, 'alive_timer', 0)
+        self.alive_max[i] = getattr(shell, 'alive_max', -1)
+        self.is_fired[i] = shell.is_fired
+        self.tag[i] = 0
+
+    def extend(self, shell, coord, velocity, tag=None):
+        '''
+        Adds many shells at once, all like the given one except for coordinate, velocity and tag.
+        :self, shell, coord, velocity, tag
+        '''
+        count = len(velocity)
+        self.reserve(count)
+        rows = slice(self.size, self.size + count)
+        self.number(self.size, self.size + count)
+        self.size += count
+        self.coord[rows] = coord
+        self.prev_coord[rows] = coord
+        self.velocity[rows] = velocity
+        self.radius[rows] = shell.radius
+        self.color[rows] = shell.color
+        self.gravity_multiplier[rows] = shell.gravity_multiplier
+        self.alive_timer[rows] = getattr(shell, 'alive_timer', 0)
+        self.alive_max[rows] = getattr(shell, 'alive_max', -1)
+        self.is_fired[rows] = shell.is_fired
+        self.tag[rows] = np.arange(count) if tag is None else tag
+
+    def check_corners(self, refl_ort=0.8, refl_par=0.9):
+        '''
+        Reflects velocities of the shells that bump into the screen corners. Implemetns inelastic rebounce.
+        :self, refl_ort, refl_par
+        '''
+        n = self.size
+        coord, velocity, radius = self.coord[:n], self.velocity[:n], self.radius[:n]
+        for i in range(2):
+            low = coord[:, i] < radius
+            high = coord[:, i] > SCREEN_SIZE[i] - radius
+            coord[low, i] = radius[low]
+            coord[high, i] = SCREEN_SIZE[i] - radius[high]
+            hit = low | high
+            velocity[hit, i] = -np.trunc(velocity[hit, i] * refl_ort)
+            velocity[hit, 1-i] = np.trunc(velocity[hit, 1-i] * refl_par)
+
+    def move(self, time=1, gravity=0):
+        '''
+        Moves all shells according to their velocity and time step, then removes dead shells.
+        :self, time, gravity
+        '''
+        n = self.size
+        coord, velocity, radius = self.coord[:n], self.velocity[:n], self.radius[:n]
+        self.prev_coord[:n] = coord
+        velocity[:, 1] += gravity * self.gravity_multiplier[:n]
+        coord += time * velocity
+        self.alive_timer[:n] += 1
+        self.check_corners()
+
+        timed = self.alive_max[:n] >= 0
+        on_floor = coord[:, 1] > SCREEN_SIZE[1] - 2*radius
+        vx, vy = velocity[:, 0], velocity[:, 1]
+        stopped = ~timed & on_floor & (vx**2 + vy**2 < 2**2)
+        expired = timed & (self.alive_timer[:n] > self.alive_max[:n])
+        self.is_fired[:n] |= ~timed & on_floor & (vx**3 + vy**3 < 3**3)
+        self.cull(~(stopped | expired))
+
+class SpatialHash:
+    '''
+    Uniform grid broadphase. Entities are bucketed by the cell of their center, so with a cell
+    at least as big as the largest interaction distance every close pair is found in the 3x3
+    neighbourhood of a cell. Rebuilt from arrays every tick.
+    '''
+    neighbours = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+    def __init__(self, cell_size=64):
+        '''
+        Constructor method.
+        :self, cell_size
+        '''
+        self.cell_size = cell_size
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.order = np.zeros(0, dtype=np.int64)
+
+    def cell_keys(self, coord):
+        cells = np.floor_divide(coord, self.cell_size).astype(np.int64)
+        return cells[:, 0] * (1 << 32) + cells[:, 1]
+
+    def build(self, coord, cell_size=None):
+        '''
+        Buckets entities by cell. Returns the hash itself so it can be queried straight away.
+        :self, coord, cell_size
+        '''
+        if cell_size is not None:
+            self.cell_size = max(cell_size, 1)
+        coord = np.asarray(coord, dtype=np.float64).reshape(-1, 2)
+        keys = self.cell_keys(coord)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+        return self
+
+    def candidates(self, coord):
+        '''
+        Yields candidate pairs (i, j) one neighbour cell offset at a time: i indexes the query
+        coordinates, j the built ones. Every pair closer than the cell size is among the candidates.
+        :self, coord
+        '''
+        coord = np.asarray(coord, dtype=np.float64).reshape(-1, 2)
+        if len(coord) == 0 or len(self.keys) == 0:
+            return
+        own_keys = self.cell_keys(coord)
+        for dx, dy in self.neighbours:
+            keys = own_keys + (dx * (1 << 32) + dy)
+            start = np.searchsorted(self.keys, keys, side='left')
+            counts = np.searchsorted(self.keys, keys, side='right') - start
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            i = np.repeat(np.arange(len(coord)), counts)
+            offset = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            yield i, self.order[start[i] + offset]
+
+def all_pairs(count_a, count_b):
+    '''
+    Every (i, j) index pair, used instead of the broadphase when there are only a few entities.
+    '''
+    i, j = np.divmod(np.arange(count_a * count_b), count_b)
+    return [(i, j)]
+
+
+# below this many pairs checking all of them is cheaper than building the grid
+DENSE_PAIRS = 4096
+
+def join_pairs(found):
+    if not found:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate([i for i, _ in found]), np.concatenate([j for _, j in found])
+
+
+def circle_pairs(coord_a, radius_a, coord_b, radius_b, grid=None):
+    '''
+    Returns index pairs (i, j) of overlapping circles a[i] and b[j]
+    using the spatial hash broadphase and a squared-distance narrowphase.
+    '''
+    if len(coord_a) == 0 or len(coord_b) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if len(coord_a) * len(coord_b) <= DENSE_PAIRS:
+        candidates = all_pairs(len(coord_a), len(coord_b))
+    else:
+        grid = grid or SpatialHash()
+        candidates = grid.build(coord_b, radius_a.max() + radius_b.max()).candidates(coord_a)
+    found = []
+    for i, j in candidates:
+        dist_sq = ((coord_a[i] - coord_b[j])**2).sum(axis=1)
+        close = dist_sq <= (radius_a[i] + radius_b[j])**2
+        found.append((i[close], j[close]))
+    return join_pairs(found)
+
+
+def box_pairs(coord_a, half_a, coord_b, half_b, grid=None):
+    '''
+    Returns index pairs (i, j) of overlapping axis-aligned boxes given by centers and half sizes,
+    with the same strict inequality as pygame.Rect.colliderect.
+    '''
+    if len(coord_a) == 0 or len(coord_b) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if len(coord_a) * len(coord_b) <= DENSE_PAIRS:
+        candidates = all_pairs(len(coord_a), len(coord_b))
+    else:
+        grid = grid or SpatialHash()
+        candidates = grid.build(coord_b, half_a.max() + half_b.max()).candidates(coord_a)
+    found = []
+    for i, j in candidates:
+        overlap = np.all(np.abs(coord_a[i] - coord_b[j]) < half_a[i] + half_b[j], axis=1)
+        found.append((i[overlap], j[overlap]))
+    return join_pairs(found)
+
+
+def time_of_impact(start, motion, reach):
+    '''
+    Earliest time in [0, 1] of the tick at which two circles moving in straight lines touch,
+    elementwise over the last axis. Start is the offset between the centers at the start of
+    the tick, motion the change of that offset over the tick and reach the sum of the radii.
+    NaN where they don't touch. Circles touching at the end of the tick always count.
+    '''
+    a = (motion**2).sum(axis=-1)
+    b = (start * motion).sum(axis=-1)
+    c = (start**2).sum(axis=-1) - reach**2
+    disc = b*b - a*c
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = (-b - np.sqrt(disc)) / a
+    touched = (a > 0) & (disc >= 0) & (t >= 0) & (t <= 1)
+    at_end = ((start + motion)**2).sum(axis=-1) <= reach**2
+    t = np.where(c <= 0, 0.0, np.where(touched, t, 1.0))
+    return np.where((c <= 0) | touched | at_end, t, np.nan)
+
+
+def swept_circle_pairs(prev_a, coord_a, radius_a, prev_b, coord_b, radius_b, grid=None):
+    '''
+    Continuous version of circle_pairs: circles move in a straight line from prev to coord
+    during the tick, so fast ones can't pass through small ones between two ticks.
+    Returns index pairs (i, j) and the time of impact of each pair, in [0, 1] of the tick.
+    The broadphase checks the circles around each whole sweep.
+    '''
+    sweep_a, sweep_b = coord_a - prev_a, coord_b - prev_b
+    i, j = circle_pairs((prev_a + coord_a) / 2, radius_a + np.hypot(sweep_a[:, 0], sweep_a[:, 1]) / 2,
+                        (prev_b + coord_b) / 2, radius_b + np.hypot(sweep_b[:, 0], sweep_b[:, 1]) / 2, grid)
+    toi = time_of_impact(prev_a[i] - prev_b[j], sweep_a[i] - sweep_b[j], radius_a[i] + radius_b[j])
+    hit = ~np.isnan(toi)
+    return i[hit], j[hit], toi[hit]
+
+
+def box_time_of_impact(start, motion, reach):
+    '''
+    Earliest time in [0, 1] of the tick at which two axis-aligned boxes moving in straight lines
+    overlap, elementwise over the last axis. Start is the offset between the centers at the start
+    of the tick, motion the change of that offset over the tick and reach the sum of the half sizes.
+    Overlap is strict as in box_pairs. NaN where they don't overlap.
+    '''
+    # the boxes overlap along an axis while the offset is strictly inside (-reach, reach)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t1, t2 = (-reach - start) / motion, (reach - start) / motion
+    still = motion == 0
+    inside = np.abs(start) < reach
+    enter = np.where(still, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2)).max(axis=-1)
+    leave = np.where(still, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2)).min(axis=-1)
+    at_end = np.all(np.abs(start + motion) < reach, axis=-1)
+    hit = ((enter < leave) & (enter < 1) & (leave > 0)) | at_end
+    toi = np.clip(np.where(enter < leave, enter, 1.0), 0.0, 1.0)
+    return np.where(hit, toi, np.nan)
+
+
+def swept_box_pairs(prev_a, coord_a, half_a, coord_b, half_b, grid=None):
+    '''
+    Continuous version of box_pairs for boxes a moving from prev to coord during the tick
+    against boxes b standing still. Overlap is strict as in box_pairs.
+    Returns index pairs (i, j) and the time of impact of each pair, in [0, 1] of the tick.
+    '''
+    sweep = coord_a - prev_a
+    i, j = box_pairs((prev_a + coord_a) / 2, half_a + np.abs(sweep) / 2, coord_b, half_b, grid)
+    toi = box_time_of_impact(prev_a[i] - coord_b[j], sweep[i], half_a[i] + half_b[j])
+    hit = ~np.isnan(toi)
+    return i[hit], j[hit], toi[hit]
+
+
+class BallisticSolver:
+    '''
+    Aiming solver for shells fired from a cannon. A shell moves in whole ticks: velocity gains
+    gravity, then coordinate gains velocity, so after n ticks a shell with velocity (vx, vy) is at
+    (x0 + n*vx, y0 + n*vy + g*n*(n+1)/2). For every flight time n this gives the velocity that
+    reaches a point in closed form; the solver takes the shortest flight the cannon has power for.
+    Cannon.strike truncates velocity to integers, so the solutions are integer velocities too.
+    Solutions for a grid of offsets are precomputed, choosing among many targets is a table lookup.
+    '''
+    def __init__(self, gravity, min_pow=10, max_pow=50, max_ticks=50, cell=8, ceiling=50):
+        '''
+        Constructor method. Ceiling is the smallest height the shell may reach without bouncing off
+        the top of the screen, max_ticks the longest flight (PowerfulShell and BigShell live 50 ticks).
+        :self, gravity, min_pow, max_pow, max_ticks, cell, ceiling
+        '''
+        self.gravity = gravity
+        self.min_pow = min_pow
+        self.max_pow = max_pow
+        self.max_ticks = max_ticks
+        self.cell = cell
+        self.ceiling = ceiling
+        self.half = np.array([SCREEN_SIZE[0] // cell, SCREEN_SIZE[1] // cell])
+        self.tables = {}
+
+    def shell_gravity(self, shell_type):
+        return self.gravity * shell_type.gravity_multiplier
+
+    def velocities(self, dx, dy, g, n):
+        '''
+        Integer velocity reaching offset (dx, dy) after n ticks, its power and the highest point
+        of the flight relative to the start (negative is up). Works elementwise on arrays.
+        :self, dx, dy, g, n
+        '''
+        vx = np.rint(dx / n)
+        vy = np.rint((dy - g * n * (n+1) / 2) / n)
+        power = np.hypot(vx, vy)
+        # the highest point is at the tick where vertical velocity turns positive
+        top = np.clip(np.ceil(-vy / g - 1) if g else n, 1, n)
+        apex = np.minimum(0, np.minimum(top*vy + g*top*(top+1)/2, n*vy + g*n*(n+1)/2))
+        return vx, vy, power, apex
+
+    def table(self, g):
+        '''
+        Returns lookup table for gravity g: vx, vy, flight ticks (0 if unreachable) and apex
+        for every cell of offsets, building it on first use.
+        :self, g
+        '''
+        if g not in self.tables:
+            ix, iy = np.meshgrid(np.arange(-self.half[0], self.half[0] + 1),
+                                 np.arange(-self.half[1], self.half[1] + 1), indexing='ij')
+            dx, dy = ix * self.cell, iy * self.cell
+            best = np.zeros(dx.shape + (4,), dtype=np.int32)
+            for n in range(1, self.max_ticks + 1):
+                vx, vy, power, apex = self.velocities(dx, dy, g, n)
+                found = (best[..., 2] == 0) & (power >= self.min_pow) & (power <= self.max_pow)
+                best[found] = np.stack([vx[found], vy[found], np.full(np.count_nonzero(found), n), apex[found]], axis=-1)
+            self.tables[g] = best
+        return self.tables[g]
+
+    def lookup(self, shell_type, dx, dy):
+        '''
+        Looks up solutions for arrays of offsets. Returns arrays vx, vy, flight ticks and apex,
+        with zero ticks where the offset can't be reached.
+        :self, shell_type, dx, dy
+        '''
+        table = self.table(self.shell_gravity(shell_type))
+        ix = np.rint(np.asarray(dx) / self.cell).astype(np.int64) + self.half[0]
+        iy = np.rint(np.asarray(dy) / self.cell).astype(np.int64) + self.half[1]
+        inside = (ix >= 0) & (ix < table.shape[0]) & (iy >= 0) & (iy < table.shape[1])
+        found = table[np.where(inside, ix, 0), np.where(inside, iy, 0)]
+        found[~inside] = 0
+        return found[..., 0], found[..., 1], found[..., 2], found[..., 3]
+
+    def solve(self, shell_type, start, target):
+        '''
+        Exact solution for one shot. Returns (angle, power, flight ticks) or None if the point can't be reached.
+        :self, shell_type, start, target
+        '''
+        n = np.arange(1, self.max_ticks + 1)
+        dx, dy = target[0] - start[0], target[1] - start[1]
+        vx, vy, power, apex = self.velocities(dx, dy, self.shell_gravity(shell_type), n)
+        ok = (power >= self.min_pow) & (power <= self.max_pow) & (start[1] + apex >= self.ceiling)
+        if not ok.any():
+            return None
+        i = int(np.argmax(ok))
+        angle, power = self.angle_power(vx[i], vy[i])
+        return angle, power, int(n[i])
+
+    def intercept(self, shell_type, start, targets, i, iterations=4):
+        '''
+        Solution for one shot at the i-th target of a TargetStore, aimed where the target will be
+        when the shell arrives. The shell moves in the same tick it is fired, so after n ticks of
+        flight the target is at position_at(tick + n); the flight time is refined a few times.
+        Returns (angle, power, flight ticks) or None.
+        :self, shell_type, start, targets, i, iterations
+        '''
+        solution = self.solve(shell_type, start, targets.coord[i])
+        for _ in range(iterations):
+            if solution is None:
+                return None
+            ahead = self.solve(shell_type, start, targets.position_at(targets.tick + solution[2], [i])[0])
+            if ahead is None or ahead[2] == solution[2]:
+                return ahead if ahead is not None else solution
+            solution = ahead
+        return solution
+
+    @staticmethod
+    def angle_power(vx, vy):
+        '''
+        Angle and power that Cannon.strike turns back into exactly (vx, vy): power is nudged up
+        so the truncation to int can't drop a unit.
+        '''
+        return math.atan2(vy, vx), math.hypot(vx, vy) * (1 + 1e-9)
+
+
+_solvers = {}
+
+def ballistic_solver(gravity):
+    '''
+    Returns the shared solver for a gravity, so lookup tables are built once per process.
+    The tables of all shell types are built with the solver: one takes 30-45 ms, which would
+    stall the frame where the NPC first fires that shell type.
+    '''
+    if gravity not in _solvers:
+        solver = BallisticSolver(gravity)
+        for shell_type in (Shell, PowerfulShell, BigShell):
+            solver.table(solver.shell_gravity(shell_type))
+        _solvers[gravity] = solver
+    return _solvers[gravity]
+
+
+class MonteCarloAimer:
+    '''
+    Lookahead aiming. Candidate shots (angle, power) are simulated ahead in batches against the
+    targets' real motion, wall bounces included, and the shot that hits soonest wins. Target
+    trajectories are evaluated once per decision with TargetStore.position_at, then every batch of
+    candidates runs as one ShellStore. Batches are evaluated until the time budget is spent. The
+    deadline is also checked on every tick of a rollout, so a small budget holds even when a
+    whole batch would take longer. Every tick of a rollout has a fixed cost, so the batch is
+    halved after a rollout cut short by the deadline and doubled, up to `batch`, after one that
+    fits: smaller batches that see the whole horizon find more hits than big ones that don't.
+    '''
+    def __init__(self, budget_ms=5.0, batch=256, horizon=50, seed=None):
+        '''
+        Constructor method.
+        :self, budget_ms, batch, horizon, seed
+        '''
+        self.budget_ns = int(budget_ms * 1e6)
+        self.batch = batch
+        self.horizon = horizon
+        self.rng = np.random.default_rng(seed)
+        self.decisions = 0
+        self.evaluated = 0
+        self.size = batch
+
+    def trajectories(self, mgr):
+        '''
+        Positions of all targets for the next `horizon` ticks, shape (horizon + 1, targets, 2), and their radii.
+        :self, mgr
+        '''
+        targets = mgr.targets
+        coord = targets.position_at(targets.tick + np.arange(self.horizon + 1))
+        return coord, targets.radius[:len(targets)].copy()
+
+    def candidates(self, cannon, seeds, count):
+        '''
+        Samples candidate angles and powers: half around the seed shots, half anywhere upwards.
+        :self, cannon, seeds, count
+        '''
+        angle = self.rng.uniform(-np.pi, 0, count)
+        power = self.rng.uniform(cannon.min_pow, cannon.max_pow, count)
+        if seeds:
+            near = count // 2
+            picked = np.array(seeds)[self.rng.integers(0, len(seeds), near)]
+            angle[:near] = picked[:, 0] + self.rng.normal(0, 0.05, near)
+            power[:near] = np.clip(picked[:, 1] + self.rng.normal(0, 2, near), cannon.min_pow, cannon.max_pow)
+        return angle, power
+
+    def rollout(self, shell_type, start, angle, power, gravity, target_coord, target_radius, deadline=None):
+        '''
+        Simulates candidate shots together. Returns the tick of the first target hit of each one,
+        horizon + 1 for misses, and the number of ticks simulated. Shots still flying when the
+        deadline passes count as misses.
+        :self, shell_type, start, angle, power, gravity, target_coord, target_radius, deadline
+        '''
+        first_hit = np.full(len(angle), self.horizon + 1)
+        tick = 0
+        velocity = np.stack([np.trunc(power * np.cos(angle)), np.trunc(power * np.sin(angle))], axis=1)
+        shells = ShellStore(len(angle))
+        shells.extend(shell_type(list(start), [0, 0], color=BLACK), start, velocity)
+        for tick in range(1, self.horizon + 1):
+            shells.move(gravity=gravity)
+            n = len(shells)
+            if n == 0:
+                break
+            # swept like Manager.collide, so fast shells don't pass through small targets
+            offset = shells.prev_coord[:n, None, :] - target_coord[tick - 1][None, :, :]
+            motion = ((shells.coord[:n] - shells.prev_coord[:n])[:, None, :]
+                      - (target_coord[tick] - target_coord[tick - 1])[None, :, :])
+            toi = time_of_impact(offset, motion, shells.radius[:n, None] + target_radius[None, :])
+            hit = ~np.all(np.isnan(toi), axis=1)
+            if hit.any():
+                first_hit[shells.tag[:n][hit]] = tick
+                shells.cull(~hit)
+            if deadline is not None and perf_counter_ns() >= deadline:
+                break
+        return first_hit, tick
+
+    def choose(self, mgr, cannon, shell_type):
+        '''
+        Returns the best (angle, power) found within the budget, or None if nothing hits.
+        :self, mgr, cannon, shell_type
+        '''
+        deadline = perf_counter_ns() + self.budget_ns
+        if len(mgr.targets) == 0:
+            return None
+        target_coord, target_radius = self.trajectories(mgr)
+        solver = ballistic_solver(mgr.gravity)
+        seeds = []
+        for i in range(len(mgr.targets)):
+            solution = solver.intercept(shell_type, cannon.coord, mgr.targets, i)
+            if solution is not None:
+                seeds.append(solution[:2])
+
+        best, best_tick = None, self.horizon + 1
+        self.decisions += 1
+        while True:
+            angle, power = self.candidates(cannon, seeds, self.size)
+            first_hit, ticks = self.rollout(shell_type, cannon.coord, angle, power, mgr.gravity,
+                                            target_coord, target_radius, deadline)
+            self.evaluated += len(angle)
+            i = int(np.argmin(first_hit))
+            if first_hit[i] < best_tick:
+                best, best_tick = (float(angle[i]), float(power[i])), first_hit[i]
+            if perf_counter_ns() >= deadline:
+                if ticks < self.horizon:
+                    self.size = max(8, self.size // 2)
+                return best
+            self.size = min(self.batch, 2 * self.size)
+
+
 class Cannon(GameObject):
     '''
     Cannon class. Manages it's renderring, movement and striking.
     :GameObject
     '''
+    __slots__ = ('coord', 'angle', 'max_pow', 'min_pow', 'color', 'active', 'pow', 'radius')
     shell_type_dict = {
         0: (100, 100, 100),
         1: (150, 150, 150),
@@ -225,17 +934,19 @@ class Cannon(GameObject):
         if self.active and self.pow < self.max_pow:
             self.pow += increment
 
-    def strike(self, shell_type):
+    def strike(self, shell_type, shells, rng=random):
         '''
-        Creates shell, according to gun's direction and current charge power.
-        :self, shell_type
+        Fires a shell into the shell store, according to gun's direction and current charge power.
+        Shell's color is drawn from rng. Returns shell's row in the store.
+        :self, shell_type, shells, rng
         '''
         vel = self.pow
         angle = self.angle
-        shell = shell_type(list(self.coord), [int(vel * np.cos(angle)), int(vel * np.sin(angle))])
+        i = shells.add(shell_type, self.coord, (int(vel * np.cos(angle)), int(vel * np.sin(angle))),
+                       rand_color(rng))
         self.pow = self.min_pow
         self.active = False
-        return shell
+        return i
         
     def set_angle(self, target_pos):
         '''
@@ -254,13 +965,13 @@ class Cannon(GameObject):
 
     def draw(self, screen, shell_type_index):
         '''
-        Draws the gun on the screen.
+        Draws the gun on the screen. Returns the rectangle covering the drawing.
         :self, screen, shell_type_index
         '''
         # draw base of the tank
         cannon_base_pos = self.coord
         
-        pg.draw.rect(screen, (255, 255, 255), 
+        base_rect = pg.draw.rect(screen, (255, 255, 255), 
                      (cannon_base_pos[0]-self.tank_base_width//2, cannon_base_pos[1], 
                       self.tank_base_width, self.tank_base_height)
         )
@@ -274,12 +985,13 @@ class Cannon(GameObject):
         gun_shape.append((gun_pos + vec_1 + vec_2).tolist())
         gun_shape.append((gun_pos + vec_2 - vec_1).tolist())
         gun_shape.append((gun_pos - vec_1).tolist())
-        pg.draw.polygon(screen, self.color, gun_shape)
+        gun_rect = pg.draw.polygon(screen, self.color, gun_shape)
 
         # draw tank cannon cover
         tank_ball_radius = 15
         ball_color = self.shell_type_dict[shell_type_index]
-        pg.draw.circle(screen, ball_color, (cannon_base_pos[0], cannon_base_pos[1]+5), tank_ball_radius)
+        ball_rect = pg.draw.circle(screen, ball_color, (cannon_base_pos[0], cannon_base_pos[1]+5), tank_ball_radius)
+        return base_rect.unionall([gun_rect, ball_rect])
 
     def check_collision(self, shell):
         '''
@@ -293,16 +1005,24 @@ class Cannon(GameObject):
     def get_rect(self):
         return pg.Rect(self.coord[0]-self.tank_base_width//2, self.coord[1]-self.tank_base_height//2, 
                        self.tank_base_width, self.tank_base_height)
+
+    def get_box(self):
+        '''
+        Center and half width and height of get_rect, computed without pygame for the physics.
+        :self
+        '''
+        return list(self.coord), [self.tank_base_width / 2, self.tank_base_height / 2]
     
 class AICannon(Cannon):
     '''
     AI-controlled cannon.
     :Cannon
     '''
-    def __init__(self, coord=None, angle=0, max_pow=50, min_pow=10, color=BLUE):
+    __slots__ = ('x_velocity', 'y_velocity')
+    def __init__(self, coord=None, angle=0, max_pow=50, min_pow=10, color=BLUE, rng=random):
         super().__init__(coord, angle, max_pow, min_pow, color)
-        self.x_velocity = randint(-2, +2)
-        self.y_velocity = randint(-2, +2)
+        self.x_velocity = rng.randint(-2, +2)
+        self.y_velocity = rng.randint(-2, +2)
     
     def move(self):
         '''
@@ -334,17 +1054,19 @@ class AICannon(Cannon):
         if self.active and self.pow < self.max_pow:
             self.pow += increment
 
-    def strike(self, shell_type):
+    def strike(self, shell_type, shells, rng=random):
         '''
-        Creates shell, according to gun's direction and current charge power.
-        :self, shell_type
+        Fires a shell into the shell store, according to gun's direction and current charge power.
+        Shell's color is drawn from rng. Returns shell's row in the store.
+        :self, shell_type, shells, rng
         '''
         vel = self.pow
         angle = self.angle
-        shell = shell_type(list(self.coord), [int(vel * np.cos(angle)), int(vel * np.sin(angle))])
+        i = shells.add(shell_type, self.coord, (int(vel * np.cos(angle)), int(vel * np.sin(angle))),
+                       rand_color(rng))
         self.pow = self.min_pow
         self.active = False
-        return shell
+        return i
     
     def set_angle(self, target_pos):
         '''
@@ -353,23 +1075,57 @@ class AICannon(Cannon):
         '''
         self.angle = np.arctan2(target_pos[1] - self.coord[1], target_pos[0] - self.coord[0])
 
+    def plan(self, mgr, shell_type, aimer):
+        '''
+        Aims with lookahead simulation, falling back to the ballistic solver if no candidate hits.
+        :self, mgr, shell_type, aimer
+        '''
+        choice = aimer.choose(mgr, self, shell_type)
+        if choice is None:
+            return self.aim(mgr.targets, shell_type, ballistic_solver(mgr.gravity))
+        self.angle, self.pow = choice
+        return choice
+
+    def aim(self, targets, shell_type, solver):
+        '''
+        Aims at the target that can be hit soonest, leading moving targets, setting both angle and power.
+        Falls back to the top left corner when no target can be reached.
+        Returns index of the chosen target in the target store or None.
+        :self, targets, shell_type, solver
+        '''
+        if len(targets) > 0:
+            coord = targets.coord[:len(targets)]
+            _, _, ticks, apex = solver.lookup(shell_type, coord[:, 0] - self.coord[0], coord[:, 1] - self.coord[1])
+            ticks = np.where((ticks > 0) & (self.coord[1] + apex >= solver.ceiling), ticks, solver.max_ticks + 1)
+            for i in np.argsort(ticks, kind='stable'):
+                if ticks[i] > solver.max_ticks:
+                    break
+                solution = solver.intercept(shell_type, self.coord, targets, i)
+                if solution is not None:
+                    self.angle, self.pow, _ = solution
+                    return int(i)
+        self.set_angle([0,0])
+        return None
+
 class Target(GameObject):
     '''
     Target class. Creates target, manages it's rendering and collision with a shell event.
     :GameObject
     '''
-    def __init__(self, coord=None, color=None, radius=30):
+    __slots__ = ('coord', 'radius', 'color')
+    def __init__(self, coord=None, color=None, radius=30, rng=random):
         '''
         Constructor method. Sets coordinate, color and radius of the target.
-        :self, coord, color, radius
+        Random values are drawn from rng, the global random module by default.
+        :self, coord, color, radius, rng
         '''
         if coord == None:
-            coord = [randint(radius, SCREEN_SIZE[0] - radius), randint(radius, SCREEN_SIZE[1] - radius)]
+            coord = [rng.randint(radius, SCREEN_SIZE[0] - radius), rng.randint(radius, SCREEN_SIZE[1] - radius)]
         self.coord = coord
         self.radius = radius
 
         if color == None:
-            color = rand_color()
+            color = rand_color(rng)
         self.color = color
 
     def check_collision(self, shell):
@@ -404,14 +1160,15 @@ class MovingTargets(Target):
     MovingTargets class. Creates a moving version of the Target class.
     :Target
     '''
-    def __init__(self, coord=None, color=None, radius=30):
+    __slots__ = ('x_velocity', 'y_velocity')
+    def __init__(self, coord=None, color=None, radius=30, rng=random):
         '''
         Constructor method. Sets coordinate, color and radius of the target.
-        :self, coord, color, radius
+        :self, coord, color, radius, rng
         '''
-        super().__init__(coord, color, radius)
-        self.x_velocity = randint(-2, +2)
-        self.y_velocity = randint(-2, +2)
+        super().__init__(coord, color, radius, rng)
+        self.x_velocity = rng.randint(-2, +2)
+        self.y_velocity = rng.randint(-2, +2)
     
     def move(self):
         '''
@@ -432,25 +1189,26 @@ class CircularTargets(Target):
     CircularTargets class. Creates a circular moving version of the Target class.
     :Target
     '''
-    def __init__(self, coord=None, color=None, radius=20, circular_radius=None, velocity=None, clockwise=None):
+    __slots__ = ('x', 'y', 'circular_radius', 'target_angle', 'velocity', 'clockwise')
+    def __init__(self, coord=None, color=None, radius=20, circular_radius=None, velocity=None, clockwise=None, rng=random):
         '''
         Constructor method. Sets coordinate, color, velocity and radius of the target.
-        :self, coord, color, radius, circular_radius, velocity, clockwise
+        :self, coord, color, radius, circular_radius, velocity, clockwise, rng
         '''
-        super().__init__(coord, color, radius)
+        super().__init__(coord, color, radius, rng)
         self.x = self.coord[0]
         self.y = self.coord[1]
         if circular_radius is None:
-            self.circular_radius = randint(20, 50)
+            self.circular_radius = rng.randint(20, 50)
         else:
             self.circular_radius = circular_radius
         self.target_angle = 1
         if velocity is None:
-            self.velocity = randint(1, 4)
+            self.velocity = rng.randint(1, 4)
         else:
             self.velocity = velocity
         if clockwise is None:
-            self.clockwise = randint(0, 1) == 1
+            self.clockwise = rng.randint(0, 1) == 1
         else:
             self.clockwise = clockwise
     
@@ -463,6 +1221,319 @@ class CircularTargets(Target):
         self.coord[1] = self.y + math.sin(math.pi * self.target_angle) * self.circular_radius
         self.target_angle += self.velocity * 0.03 * (1 if self.clockwise else -1)
 
+class TargetStore(ArrayStore):
+    '''
+    Live targets of all three types as arrays. Target motion depends only on the ticks since spawn,
+    so positions are evaluated in closed form at any tick with position_at: moving targets bounce
+    as a triangle wave between their turning points, circular targets are one cos/sin of the angle.
+    Matches Target, MovingTargets and CircularTargets move methods stepped tick by tick.
+    '''
+    STATIC, MOVING, CIRCULAR = 0, 1, 2
+    fields = {
+        'coord': (np.float64, (2,)),
+        'prev_coord': (np.float64, (2,)), # coordinate before the last move, for interpolation
+        'radius': (np.float64, ()),
+        'color': (np.uint8, (3,)),
+        'kind': (np.int8, ()),
+        'origin': (np.float64, (2,)), # coordinate at spawn
+        'spawn_tick': (np.int64, ()),
+        'velocity': (np.float64, (2,)), # moving targets, velocity at spawn
+        'low': (np.float64, (2,)), # moving targets, turning points below and above the borders
+        'high': (np.float64, (2,)),
+        'center': (np.float64, (2,)), # circular targets
+        'circular_radius': (np.float64, ()),
+        'target_angle': (np.float64, ()), # circular targets, angle at the first move
+        'angle_step': (np.float64, ()),
+        'uid': (np.int64, ()),
+    }
+
+    def __init__(self, capacity=64):
+        '''
+        Constructor method. Tick counts the moves made so far.
+        :self, capacity
+        '''
+        super().__init__(capacity)
+        self.tick = 0
+
+    def copy(self):
+        clone = super().copy()
+        clone.tick = self.tick
+        return clone
+
+    def append(self, target):
+        '''
+        Copies a target object into the store, spawning it at the current tick.
+        :self, target
+        '''
+        i = self.push()
+        self.coord[i] = target.coord
+        self.prev_coord[i] = target.coord
+        self.origin[i] = target.coord
+        self.spawn_tick[i] = self.tick
+        self.radius[i] = target.radius
+        self.color[i] = target.color
+        for name in ('velocity', 'low', 'high', 'center', 'circular_radius', 'target_angle', 'angle_step'):
+            getattr(self, name)[i] = 0
+        if isinstance(target, CircularTargets):
+            self.kind[i] = self.CIRCULAR
+            self.center[i] = (target.x, target.y)
+            self.circular_radius[i] = target.circular_radius
+            self.target_angle[i] = target.target_angle
+            self.angle_step[i] = target.velocity * 0.03 * (1 if target.clockwise else -1)
+        elif isinstance(target, MovingTargets):
+            self.kind[i] = self.MOVING
+            velocity = np.array([target.x_velocity, target.y_velocity], dtype=np.float64)
+            self.velocity[i] = velocity
+            # velocity turns once the target is past a border, so the turning points are the first
+            # positions on the target's lattice origin + k*|velocity| outside of [radius, screen - radius],
+            # an axis without velocity has both turning points at the origin
+            speed = np.where(velocity != 0, np.abs(velocity), 1)
+            origin, radius = self.origin[i], target.radius
+            self.high[i] = np.where(velocity != 0, origin + (np.floor((np.array(SCREEN_SIZE) - radius - origin) / speed) + 1) * speed, origin)
+            self.low[i] = np.where(velocity != 0, origin - (np.floor((origin - radius) / speed) + 1) * speed, origin)
+        else:
+            self.kind[i] = self.STATIC
+
+    def position_at(self, tick, rows=None):
+        '''
+        Coordinates of the targets after `tick` moves of the store, without stepping through the
+        ticks in between. Tick may be an array, the result then has shape tick.shape + (rows, 2).
+        Rows selects targets by index, all live targets by default. Ticks before a target's spawn
+        extrapolate its motion backwards.
+        :self, tick, rows
+        '''
+        if rows is None:
+            rows = slice(0, self.size)
+        kind = self.kind[rows]
+        elapsed = np.asarray(tick)[..., None] - self.spawn_tick[rows]
+        coord = np.broadcast_to(self.origin[rows], elapsed.shape + (2,)).copy()
+
+        moving = kind == self.MOVING
+        if moving.any():
+            low, high = self.low[rows][moving], self.high[rows][moving]
+            unfolded = self.origin[rows][moving] + elapsed[..., moving, None] * self.velocity[rows][moving]
+            # reflecting at both turning points is a triangle wave with period 2 * (high - low)
+            period = np.maximum(2 * (high - low), 1) # a stopped axis stays at low
+            phase = np.mod(unfolded - low, period)
+            coord[..., moving, :] = low + np.minimum(phase, period - phase)
+
+        circular = kind == self.CIRCULAR
+        if circular.any():
+            # the first move puts the target on the circle at its starting angle
+            moved = elapsed[..., circular]
+            angle = self.target_angle[rows][circular] + (moved - 1) * self.angle_step[rows][circular]
+            radius = self.circular_radius[rows][circular]
+            center = self.center[rows][circular]
+            on_circle = np.stack([center[:, 0] + np.cos(np.pi * angle) * radius,
+                                  center[:, 1] + np.sin(np.pi * angle) * radius], axis=-1)
+            coord[..., circular, :] = np.where((moved > 0)[..., None], on_circle, coord[..., circular, :])
+        return coord
+
+    def seek(self, tick):
+        '''
+        Jumps to the positions after `tick` moves, e.g. for fast-forward or replay seeking.
+        :self, tick
+        '''
+        self.tick = tick
+        self.prev_coord[:self.size] = self.position_at(tick - 1)
+        self.coord[:self.size] = self.position_at(tick)
+
+    def move(self):
+        '''
+        Moves all targets one tick.
+        :self
+        '''
+        self.tick += 1
+        self.prev_coord[:self.size] = self.coord[:self.size]
+        self.coord[:self.size] = self.position_at(self.tick)
+
+
+class BombStore(ArrayStore):
+    '''
+    Live bombs as arrays, moved as one batch. Behaves as Bomb.move applied to every row.
+    '''
+    fields = {
+        'coord': (np.float64, (2,)),
+        'prev_coord': (np.float64, (2,)), # coordinate before the last move, for interpolation
+        'velocity': (np.float64, (2,)),
+        'radius': (np.float64, ()),
+        'gravity': (np.float64, ()),
+        'uid': (np.int64, ()),
+    }
+
+    def append(self, bomb):
+        '''
+        Copies a bomb object into the store.
+        :self, bomb
+        '''
+        i = self.push()
+        self.coord[i] = bomb.coord
+        self.prev_coord[i] = bomb.coord
+        self.velocity[i] = bomb.velocity
+        self.radius[i] = bomb.radius
+        self.gravity[i] = bomb.gravity
+
+    def add(self, coord, velocity, radius=10, gravity=2):
+        '''
+        Writes a new bomb straight into a new row, no bomb object is created. Defaults match Bomb.
+        :self, coord, velocity, radius, gravity
+        '''
+        i = self.push()
+        self.coord[i] = coord
+        self.prev_coord[i] = coord
+        self.velocity[i] = velocity
+        self.radius[i] = radius
+        self.gravity[i] = gravity
+
+    def move(self):
+        '''
+        Moves all bombs one tick.
+        :self
+        '''
+        n = self.size
+        coord = self.coord[:n]
+        self.prev_coord[:n] = coord
+        coord[:, 1] += self.gravity[:n]
+        coord += self.velocity[:n]
+
+    def on_screen(self):
+        '''
+        Mask of the bombs still inside the screen: not below the bottom and not past the sides.
+        :self
+        '''
+        n = self.size
+        x, y, radius = self.coord[:n, 0], self.coord[:n, 1], self.radius[:n]
+        return (y <= SCREEN_SIZE[1]) & (x - radius >= 0) & (x + radius <= SCREEN_SIZE[0])
+
+
+class LRUCache:
+    '''
+    Bounded cache that evicts the least recently used entry. Counts hits and misses.
+    '''
+    def __init__(self, maxsize=128):
+        '''
+        Constructor method.
+        :self, maxsize
+        '''
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, make):
+        '''
+        Returns the cached value for the key, creating it with make() on a miss.
+        :self, key, make
+        '''
+        entries = self.entries
+        value = entries.get(key)
+        if value is not None:
+            entries.move_to_end(key)
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = entries[key] = make()
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.entries.clear()
+
+
+class TextCache(LRUCache):
+    '''
+    Rendered text surfaces keyed on the displayed string and color, so unchanged HUD lines are
+    blitted from the cache and only changed lines are rasterized again.
+    '''
+    def __init__(self, font, maxsize=64):
+        '''
+        Constructor method.
+        :self, font, maxsize
+        '''
+        super().__init__(maxsize)
+        self.font = font
+
+    def render(self, text, color):
+        '''
+        Returns antialiased surface with the text.
+        :self, text, color
+        '''
+        return self.get((text, color), lambda: self.font.render(text, True, color))
+
+
+_text_caches = {}
+_font_paths = {}
+
+def font_path(name):
+    '''
+    Returns the file of a system font, None for pygame's default font if it isn't installed.
+    Looking fonts up scans the system's fonts, so each name is only looked up once.
+    '''
+    if name not in _font_paths:
+        _font_paths[name] = pg.font.match_font(name)
+    return _font_paths[name]
+
+def hud_text(name="dejavusansmono", size=25):
+    '''
+    Returns the shared text cache for a system font, loading the font on first use.
+    '''
+    if not pg.font.get_init():
+        # fonts loaded before a pg.quit() can't render any more
+        _text_caches.clear()
+        pg.font.init()
+    key = (name, size)
+    if key not in _text_caches:
+        _text_caches[key] = TextCache(pg.font.Font(font_path(name), size))
+    return _text_caches[key]
+
+
+class SpriteCache(LRUCache):
+    '''
+    Pre-rendered sprites of the parts of the picture that look the same for every entity of
+    a size: black bombs and the white rings of targets, keyed by (kind, radius). Shells and
+    the target disks have random colors, which would make every key a miss, so they are drawn
+    with pg.draw and the target rings are blitted over them. The holes of the rings and the
+    corners use an RLE color key, which blits faster than per-pixel alpha.
+    '''
+    colorkey = (255, 0, 255)
+    rings = {
+        "target": [(0.7, WHITE), (0.5, None), (0.3, WHITE)],
+        "bomb": [(1, BLACK)],
+    }
+
+    def __init__(self, maxsize=256):
+        super().__init__(maxsize)
+
+    def sprite(self, kind, radius):
+        '''
+        Returns the sprite, its center is at (radius, radius).
+        :self, kind, radius
+        '''
+        return self.get((kind, radius), lambda: self.paint(kind, radius))
+
+    def paint(self, kind, radius):
+        surface = pg.Surface((2*radius + 1, 2*radius + 1))
+        surface.fill(self.colorkey)
+        for scale, ring_color in self.rings[kind]:
+            pg.draw.circle(surface, self.colorkey if ring_color is None else ring_color, (radius, radius), radius * scale)
+        if pg.display.get_surface() is not None:
+            surface = surface.convert()
+        surface.set_colorkey(self.colorkey, pg.RLEACCEL)
+        return surface
+
+    def blit_list(self, kind, coords, radii):
+        '''
+        Returns (sprite, top-left corner) pairs for Surface.blits.
+        :self, kind, coords, radii
+        '''
+        sprite = self.sprite
+        return [(sprite(kind, radius), (x - radius, y - radius)) for (x, y), radius in zip(coords, radii)]
+
+
 class ScoreTable:
     '''
     Score table class.
@@ -471,7 +1542,7 @@ class ScoreTable:
         self.target_destroyed = target_destroyed
         self.shell_used = shell_used
         self.hit = 0
-        self.font = pg.font.SysFont("dejavusansmono", 25)
+        self.text = None
 
     def score(self):
         '''
@@ -483,39 +1554,434 @@ class ScoreTable:
     def draw(self, screen):
         '''
         Method that raws a score screen on the top left of the user's screen.
+        Returns rectangles of the drawn lines.
         :self, screen
         '''
-        score_surface = []
-        score_surface.append(self.font.render("Destroyed: {}".format(self.target_destroyed), True, WHITE))
-        score_surface.append(self.font.render("Shell used: {}".format(self.shell_used), True, WHITE))
-        score_surface.append(self.font.render(f"Hit: {self.hit}", True, WHITE))
-        score_surface.append(self.font.render("Total: {}".format(self.score()), True, RED))
-        for i in range(len(score_surface)):
-            screen.blit(score_surface[i], [10, 10+30*i])
+        if self.text is None:
+            # loaded on first draw, so headless games never touch the font module
+            self.text = hud_text("dejavusansmono", 25)
+        lines = [
+            ("Destroyed: {}".format(self.target_destroyed), WHITE),
+            ("Shell used: {}".format(self.shell_used), WHITE),
+            (f"Hit: {self.hit}", WHITE),
+            ("Total: {}".format(self.score()), RED),
+        ]
+        return [screen.blit(self.text.render(line, color), [10, 10+30*i])
+                for i, (line, color) in enumerate(lines)]
+
+
+class FrameProfiler:
+    '''
+    Opt-in per-phase frame timer. Phase times of the last `size` frames are kept in a fixed-size
+    ring buffer and summarized as p50/p95/p99 frame times in an overlay next to the score table.
+    '''
+    phases = ["handle_events", "move", "collide", "bomb_process", "new_mission", "draw", "flip"]
+    budget_ms = 1000 / 30
+
+    def __init__(self, size=256):
+        '''
+        Constructor method.
+        :self, size
+        '''
+        self.size = size
+        self.samples = np.zeros((size, len(self.phases)), dtype=np.int64)
+        self.current = np.zeros(len(self.phases), dtype=np.int64)
+        self.phase_index = {name: i for i, name in enumerate(self.phases)}
+        self.count = 0
+        self.last = 0
+        self.in_frame = False
+        self.text = None
+
+    def start_frame(self):
+        '''
+        Starts timing a new frame, closing the previous one if it is still open.
+        :self
+        '''
+        if self.in_frame:
+            self.end_frame()
+        self.current[:] = 0
+        self.in_frame = True
+        self.last = perf_counter_ns()
+
+    def lap(self, phase):
+        '''
+        Adds time passed since the previous lap to the given phase.
+        :self, phase
+        '''
+        now = perf_counter_ns()
+        self.current[self.phase_index[phase]] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        '''
+        Stores current frame's phase times in the ring buffer.
+        :self
+        '''
+        self.samples[self.count % self.size] = self.current
+        self.count += 1
+        self.in_frame = False
+
+    def recorded(self):
+        return self.samples[:min(self.count, self.size)]
+
+    def percentiles(self, q=(50, 95, 99)):
+        '''
+        Returns frame time percentiles in milliseconds.
+        :self, q
+        '''
+        frames = self.recorded()
+        if len(frames) == 0:
+            return [0.0 for _ in q]
+        return (np.percentile(frames.sum(axis=1), q) / 1e6).tolist()
+
+    def phase_means(self):
+        '''
+        Returns mean time of each phase in milliseconds.
+        :self
+        '''
+        frames = self.recorded()
+        if len(frames) == 0:
+            return dict.fromkeys(self.phases, 0.0)
+        return dict(zip(self.phases, (frames.mean(axis=0) / 1e6).tolist()))
+
+    def draw(self, screen, mgr):
+        '''
+        Draws frame time percentiles, the slowest phase and entity counts right of the score table.
+        Returns rectangles of the drawn lines.
+        :self, screen, mgr
+        '''
+        if self.text is None:
+            self.text = hud_text("dejavusansmono", 16)
+        p50, p95, p99 = self.percentiles()
+        means = self.phase_means()
+        slowest = max(means, key=means.get)
+        lines = [
+            "frame p50 {:.1f} p95 {:.1f} p99 {:.1f} ms".format(p50, p95, p99),
+            "slowest: {} {:.2f} ms".format(slowest, means[slowest]),
+            "shells {} targets {} bombs {}".format(len(mgr.shells), len(mgr.targets), len(mgr.bombs)),
+        ]
+        color = RED if p95 > self.budget_ms else WHITE
+        return [screen.blit(self.text.render(line, color), [300, 10+20*i])
+                for i, line in enumerate(lines)]
+
+
+class DirtyRectRenderer:
+    '''
+    Dirty rectangle renderer. Keeps rectangles of everything drawn last frame, restores only
+    those background areas, draws the entities and updates the display where something changed.
+    Falls back to a full redraw and flip when the dirty area gets too big.
+    '''
+    def __init__(self, threshold=0.5, background=DARK_GREY):
+        '''
+        Constructor method. Threshold is the part of the screen area above which the whole display is flipped.
+        :self, threshold, background
+        '''
+        self.threshold = threshold
+        self.background = background
+        self.previous = []
+        self.dirty = []
+        self.full = True
+        self.full_frames = 0
+        self.partial_frames = 0
+
+    def invalidate(self):
+        '''
+        Forces full redraw on the next frame, e.g. after the window was exposed.
+        :self
+        '''
+        self.full = True
+
+    def draw(self, screen, mgr, alpha=1.0):
+        '''
+        Restores background under last frame's drawings and draws the manager's entities.
+        :self, screen, mgr, alpha
+        '''
+        if self.full:
+            screen.fill(self.background)
+        else:
+            for rect in self.previous:
+                screen.fill(self.background, rect)
+        current = []
+        mgr.draw_entities(screen, current, alpha)
+        self.dirty = self.previous + current
+        self.previous = current
+
+    def present(self):
+        '''
+        Pushes changed areas to the display, or the whole buffer when they cover too much of it.
+        :self
+        '''
+        screen_area = SCREEN_SIZE[0] * SCREEN_SIZE[1]
+        dirty_area = sum(rect.width * rect.height for rect in self.dirty)
+        if self.full or dirty_area > self.threshold * screen_area:
+            pg.display.flip()
+            self.full_frames += 1
+        else:
+            pg.display.update(self.dirty)
+            self.partial_frames += 1
+        self.full = False
+
+
+class FixedTimestep:
+    '''
+    Runs the simulation at a fixed rate independent of the render rate. Frame time is collected
+    in an accumulator and spent in whole physics ticks; what is left over is the interpolation
+    factor for drawing. At most max_substeps ticks run per frame, any further backlog is dropped,
+    so a slow frame can't make the next one even slower.
+    '''
+    def __init__(self, mgr, physics_hz=30, max_substeps=5):
+        '''
+        Constructor method.
+        :self, mgr, physics_hz, max_substeps
+        '''
+        self.mgr = mgr
+        self.dt = 1 / physics_hz
+        self.max_substeps = max_substeps
+        self.accumulator = 0.0
+        self.pending = None
+        self.ticks = 0
+        self.dropped_time = 0.0
+
+    def advance(self, frame_time, action):
+        '''
+        Runs as many physics ticks as fit into the accumulated time and returns the interpolation factor.
+        Input that arrives on frames without a tick is kept for the next tick.
+        :self, frame_time, action
+        '''
+        self.pending = action if self.pending is None else self.pending.merge(action)
+        self.accumulator += frame_time
+        substeps = 0
+        while self.accumulator >= self.dt and substeps < self.max_substeps:
+            self.mgr.step(self.pending)
+            self.pending = self.pending.held()
+            self.accumulator -= self.dt
+            substeps += 1
+        self.ticks += substeps
+        if self.accumulator >= self.dt:
+            backlog = self.accumulator
+            self.accumulator %= self.dt
+            self.dropped_time += backlog - self.accumulator
+        return self.accumulator / self.dt
+
+
+class PipelinedLoop:
+    '''
+    Runs the simulation at a fixed rate on its own thread while the main thread draws.
+    After its ticks the simulation thread publishes a clone of the game, which it never
+    touches again, into a one-slot deque, and the main thread draws the latest one. Appending
+    to and popping from a deque are atomic, so the handoff takes no lock and neither side waits.
+    pygame releases the GIL while it fills and blits, so drawing overlaps with the next ticks.
+    Ticks replaced before they were drawn count as dropped frames, frames that draw a tick
+    already drawn count as duplicated.
+    '''
+    def __init__(self, mgr, physics_hz=30, max_substeps=5):
+        '''
+        Constructor method. The profiler moves to the loop, it times the main thread only.
+        :self, mgr, physics_hz, max_substeps
+        '''
+        self.mgr = mgr
+        self.dt = 1 / physics_hz
+        self.max_substeps = max_substeps
+        self.profiler, mgr.profiler = mgr.profiler, None
+        self.inputs = deque()
+        self.latest = deque(maxlen=1)
+        self.frame = None
+        self.published = 0.0
+        self.ticks = 0
+        self.dropped_time = 0.0
+        self.frames = 0
+        self.dropped_frames = 0
+        self.duplicated_frames = 0
+        self.error = None
+        self.running = False
+        self.thread = None
+        self.latest.append((mgr.clone(), perf_counter()))
+
+    def start(self):
+        '''
+        Starts the simulation thread.
+        :self
+        '''
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="simulation", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        '''
+        Stops the simulation thread and waits for its tick to finish, so the manager can be saved.
+        :self
+        '''
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        '''
+        Simulation thread: spends the time passed in whole ticks like FixedTimestep, with the input
+        the main thread submitted since the last tick, and publishes the game after them.
+        :self
+        '''
+        pending = Action()
+        accumulator = 0.0
+        last = perf_counter()
+        try:
+            while self.running:
+                now = perf_counter()
+                accumulator += now - last
+                last = now
+                substeps = 0
+                while accumulator >= self.dt and substeps < self.max_substeps:
+                    while self.inputs:
+                        pending = pending.merge(self.inputs.popleft())
+                    self.mgr.step(pending)
+                    pending = pending.held()
+                    accumulator -= self.dt
+                    substeps += 1
+                if substeps:
+                    self.ticks += substeps
+                    self.latest.append((self.mgr.clone(), now - accumulator))
+                if accumulator >= self.dt:
+                    backlog = accumulator
+                    accumulator %= self.dt
+                    self.dropped_time += backlog - accumulator
+                sleep(self.dt - accumulator)
+        except Exception as error:
+            self.error = error
+            self.running = False
+
+    def submit(self, action):
+        '''
+        Hands the input of a frame to the simulation thread.
+        :self, action
+        '''
+        self.inputs.append(action)
+
+    def take(self):
+        '''
+        Returns the latest published game to draw and its interpolation factor.
+        Raises the simulation thread's error if it crashed.
+        :self
+        '''
+        if self.error is not None:
+            raise self.error
+        try:
+            frame, published = self.latest.pop()
+        except IndexError:
+            frame, published = self.frame, self.published
+            self.duplicated_frames += 1
+        else:
+            if self.frame is not None:
+                self.dropped_frames += max(0, frame.tick - self.frame.tick - 1)
+            self.frame, self.published = frame, published
+            frame.renderer = self.mgr.renderer
+            frame.profiler = self.profiler
+        self.frames += 1
+        return frame, min(1.0, (perf_counter() - published) / self.dt)
+
+
+class Action:
+    '''
+    Player's input for a single tick. Built from pygame events by Manager.handle_events
+    or directly by scripts and agents driving a headless game.
+    '''
+    def __init__(self, aim=None, charge=False, fire=False, switch=False, direction=0, quit=False, queued_switches=0):
+        '''
+        Constructor method. Queued_switches are shell switches pressed on top of this tick's one,
+        applied one per tick on the following ticks.
+        :self, aim, charge, fire, switch, direction, quit, queued_switches
+        '''
+        self.aim = aim
+        self.charge = charge
+        self.fire = fire
+        self.switch = switch
+        self.direction = direction
+        self.quit = quit
+        self.queued_switches = queued_switches
+
+    def merge(self, later):
+        '''
+        Combines with a later action: one-shot presses of both are kept, aim and direction are taken from the later one.
+        A switch pressed in both is applied once now and once more on the next tick.
+        :self, later
+        '''
+        queued = self.queued_switches + later.queued_switches + (bool(self.switch) and bool(later.switch))
+        return Action(aim=later.aim if later.aim is not None else self.aim,
+                      charge=self.charge or later.charge, fire=self.fire or later.fire,
+                      switch=self.switch or later.switch, direction=later.direction,
+                      quit=self.quit or later.quit, queued_switches=queued)
+
+    def held(self):
+        '''
+        Part of the action that lasts over several ticks: aim, direction and the queued switches,
+        without the one-shot presses.
+        :self
+        '''
+        return Action(aim=self.aim, direction=self.direction, switch=self.queued_switches > 0,
+                      queued_switches=max(0, self.queued_switches - 1))
 
 
 class Manager:
     '''
     Class that manages events' handling, shell's motion and collision, target creation, etc.
     '''
-    def __init__(self, num_of_targets=1, gravity=2):
+    def __init__(self, num_of_targets=1, gravity=2, bomb_chance=0.005, max_radius=30, shrink=1, seed=None):
+        '''
+        Constructor method. Max_radius and shrink set how target radius shrinks as score goes up.
+        All randomness of the game comes from the manager's own generator, so the same seed and
+        the same actions always play the same game.
+        :self, num_of_targets, gravity, bomb_chance, max_radius, shrink, seed
+        '''
+        self.seed = seed
+        self.rng = random.Random(seed)
         self.shell_types = [Shell, PowerfulShell, BigShell]
         self.shell_type_index = 0
         self.shell_type = self.shell_types[0]
-        self.shells = []
+        self.shells = ShellStore()
 
-        self.bomb_chance = 0.005
-        self.bombs: list[Bomb] = []
+        self.bomb_chance = bomb_chance
+        self.bombs = BombStore()
 
         self.gun = Cannon()
-        self.npc = AICannon()
+        self.npc = AICannon(rng=self.rng)
 
-        self.targets: list[Target] = []
+        self.targets = TargetStore()
         self.score_table = ScoreTable()
         self.num_of_targets = num_of_targets
         self.gravity = gravity
+        self.max_radius = max_radius
+        self.shrink = shrink
+        self.grid = SpatialHash()
+        self.sprites = SpriteCache()
+        self.renderer = None
+        self.profiler = None
+        self.npc_aimer = None
+        self.recorder = None
+        self.tick = 0
         self.new_mission()
 
+    def clone(self):
+        '''
+        Independent copy of the simulation state for looking ahead. Much cheaper than deepcopy:
+        shell arrays are copied, game objects get their own coordinate lists, caches are shared
+        and nothing of the rendering or profiling is taken along.
+        :self
+        '''
+        clone = copy.copy(self)
+        clone.rng = copy.copy(self.rng)
+        clone.shells = self.shells.copy()
+        clone.targets = self.targets.copy()
+        clone.bombs = self.bombs.copy()
+        clone.gun = self.gun.copy()
+        clone.npc = self.npc.copy()
+        clone.score_table = copy.copy(self.score_table)
+        clone.grid = SpatialHash()
+        clone.renderer = None
+        clone.profiler = None
+        clone.npc_aimer = None
+        clone.recorder = None
+        return clone
+
     def new_mission(self):
         '''
         Adds new targets.
@@ -525,12 +1991,17 @@ class Manager:
         for _ in range(self.num_of_targets):
             # as score goes up, the radius of the target shrink
             for target_type in target_types:
-                self.targets.append(
-                    target_type(radius=randint(
-                        max(1, 30 - 2 * max(0, self.score_table.score())),
-                        30 - max(0, self.score_table.score()))
-                    )
-                )
+                self.targets.append(target_type(radius=self.rng.randint(*self.target_radius_range()), rng=self.rng))
+
+    def target_radius_range(self):
+        '''
+        Smallest and largest radius of new targets for the current score.
+        :self
+        '''
+        score = max(0, self.score_table.score())
+        low = max(1, self.max_radius - 2 * self.shrink * score)
+        high = max(low, self.max_radius - self.shrink * score)
+        return int(low), int(high)
 
     def bomb_process(self):
         """
@@ -539,75 +2010,156 @@ class Manager:
         :self
         """
         # spawn
-        for target in self.targets:
-            if random() < self.bomb_chance:
-                self.bombs.append(Bomb([target.coord[0], target.coord[1]]))
+        rng = self.rng
+        coord = self.targets.coord
+        for i in range(len(self.targets)):
+            if rng.random() < self.bomb_chance:
+                # velocity is drawn as in Bomb
+                self.bombs.add(coord[i], (rng.randint(-2, 2), rng.randint(-1, 2)))
 
         # destroy if below screen
-        bombs_destroy = []
-        for bomb in self.bombs:
-            if bomb.coord[1] > SCREEN_SIZE[1] or \
-                    bomb.coord[0] - bomb.radius < 0 or \
-                    bomb.coord[0] + bomb.radius > SCREEN_SIZE[0]:
-                bombs_destroy.append(bomb)
-        for bomb in bombs_destroy:
-            self.bombs.remove(bomb)
+        self.bombs.cull(self.bombs.on_screen())
 
     def process(self, events, screen):
         '''
-        Runs all necessary method for each iteration. Adds new targets, if previous are destroyed.
+        Runs all necessary method for each iteration: turns pygame events and mouse state
+        into an action, advances the simulation one tick and renders it.
         :self, events, screen
         '''
-        done = self.handle_events(events)
+        prof = self.profiler
+        if prof is not None:
+            prof.start_frame()
+
+        action = self.read_input(events)
+        if prof is not None:
+            prof.lap("handle_events")
+
+        self.step(action)
+        self.draw(screen)
+        if prof is not None:
+            prof.lap("draw")
+
+        return action.quit
+
+    def read_input(self, events):
+        '''
+        Turns pygame events and mouse position into an action.
+        :self, events
+        '''
+        action = self.handle_events(events)
 
         if pg.mouse.get_focused():
-            mouse_pos = pg.mouse.get_pos()
-            self.gun.set_angle(mouse_pos)
-        
+            action.aim = pg.mouse.get_pos()
+        return action
+
+    def step(self, action=None):
+        '''
+        Advances the game by one tick without a screen, font or mouse.
+        Applies the action, moves and collides everything, drops bombs and
+        adds new targets if previous are destroyed. With a recorder set, the action is logged first.
+        :self, action
+        '''
+        if action is None:
+            action = Action()
+        if self.recorder is not None:
+            action = self.recorder.record(self, action)
+        if self.profiler is not None:
+            return self.step_profiled(action)
+        self.apply_action(action)
+
         self.move()
         self.collide()
-        self.draw(screen)
         self.bomb_process()
+        self.check_mission()
+
+    def step_profiled(self, action):
+        '''
+        Same as step, but times every phase with the profiler.
+        :self, action
+        '''
+        prof = self.profiler
+        self.apply_action(action)
+        prof.lap("handle_events")
+        self.move()
+        prof.lap("move")
+        self.collide()
+        prof.lap("collide")
+        self.bomb_process()
+        prof.lap("bomb_process")
+        self.check_mission()
+        prof.lap("new_mission")
 
+    def check_mission(self):
+        '''
+        Adds new targets if previous are destroyed and closes the tick.
+        :self
+        '''
         if len(self.targets) == 0 and len(self.shells) == 0:
             self.new_mission()
-
-        return done
+        self.tick += 1
+
+    def apply_action(self, action):
+        '''
+        Applies player's input to the gun. The AI cannon may answer a charge with a shot of its own.
+        :self, action
+        '''
+        if action.charge:
+            self.gun.activate()
+            counter_interval = 1
+            counter = self.rng.randint(0, 2)
+            if counter == counter_interval:
+                self.npc.activate()
+                if self.npc_aimer is not None:
+                    self.npc.plan(self, self.shell_type, self.npc_aimer)
+                else:
+                    self.npc.aim(self.targets, self.shell_type, ballistic_solver(self.gravity))
+                self.fire(self.npc)
+        if action.fire:
+            self.fire(self.gun)
+            self.score_table.shell_used += 1
+        if action.switch:
+            self.switch_shell_type()
+        if action.direction:
+            self.gun.move(10 * action.direction)
+        if action.aim is not None:
+            self.gun.set_angle(action.aim)
+
+    def fire(self, gun):
+        '''
+        Fires the loaded shell type from a gun.
+        :self, gun
+        '''
+        gun.strike(self.shell_type, self.shells, self.rng)
 
     def handle_events(self, events):
         '''
-        Handles events from keyboard, mouse, etc.
+        Handles events from keyboard, mouse, etc. and returns them as an action.
         :self, events
         '''
-        done = False
-        counter_interval = 1
+        action = Action()
         for event in events:
             if event.type == pg.QUIT:
-                done = True
+                action.quit = True
             elif event.type == pg.MOUSEBUTTONDOWN:
                 if event.button == 1:
-                    self.gun.activate()
-                    counter = randint(0, 2)
-                    if counter == counter_interval:
-                        self.npc.activate()
-                        self.npc.set_angle([0,0])
-                        self.shells.append(self.npc.strike(self.shell_type))
+                    action.charge = True
             elif event.type == pg.MOUSEBUTTONUP:
                 if event.button == 1:
-                    self.shells.append(self.gun.strike(self.shell_type))
-                    self.score_table.shell_used += 1
+                    action.fire = True
             elif event.type == pg.KEYDOWN:
                 if event.key == pg.K_SPACE:
-                    self.switch_shell_type()
+                    if action.switch:
+                        action.queued_switches += 1
+                    action.switch = True
                 elif event.key == pg.K_q:
-                    done = True
+                    action.quit = True
         keys = pg.key.get_pressed()
         if keys[pg.K_LEFT] or keys[pg.K_a]:
-            self.gun.move(-10)
+            action.direction -= 1
         if keys[pg.K_RIGHT] or keys[pg.K_d]:
-            self.gun.move(10)
+            action.direction += 1
 
-        return done
+        return action
     
     def switch_shell_type(self):
         '''
@@ -617,39 +2169,78 @@ class Manager:
         self.shell_type_index = (self.shell_type_index + 1) % len(self.shell_types)
         self.shell_type = self.shell_types[self.shell_type_index]
 
-    def draw(self, screen):
+    def draw(self, screen, alpha=1.0):
         '''
         Runs shell', gun's, targets' and score table's drawing method.
-        :self, screen
+        With a dirty rectangle renderer set, only changed areas are redrawn.
+        Alpha below 1 draws shells, targets and bombs between their previous and current tick positions.
+        :self, screen, alpha
         '''
+        if self.renderer is not None:
+            self.renderer.draw(screen, self, alpha)
+            return
         screen.fill(DARK_GREY) # fill background
+        self.draw_entities(screen, alpha=alpha)
 
-        for shell in self.shells:
-            shell.draw(screen)
-        for target in self.targets:
-            target.draw(screen)
-        for bomb in self.bombs:
-            bomb.draw(screen)
-        self.gun.draw(screen, self.shell_type_index)
-        self.npc.draw(screen, self.shell_type_index)
-        self.score_table.draw(screen)
+    def tanks(self):
+        '''
+        Cannons on the field, each with the index of the shell type it shows as loaded.
+        :self
+        '''
+        return [(self.gun, self.shell_type_index), (self.npc, self.shell_type_index)]
+
+    def draw_entities(self, screen, rects=None, alpha=1.0):
+        '''
+        Draws everything but the background. If a list is given, rectangles of all drawings are added to it.
+        :self, screen, rects, alpha
+        '''
+        n = len(self.shells)
+        shell_coord = self.shells.coord[:n]
+        n_targets = len(self.targets)
+        target_coord = self.targets.coord[:n_targets]
+        n_bombs = len(self.bombs)
+        bomb_coord = self.bombs.coord[:n_bombs]
+        if alpha < 1.0:
+            shell_coord = lerp(self.shells.prev_coord[:n], shell_coord, alpha)
+            target_coord = lerp(self.targets.prev_coord[:n_targets], target_coord, alpha)
+            bomb_coord = lerp(self.bombs.prev_coord[:n_bombs], bomb_coord, alpha)
+
+        drawn = []
+        circle = pg.draw.circle
+        for color, center, radius in zip(self.shells.color[:n].tolist(), shell_coord.tolist(),
+                                         self.shells.radius[:n].tolist()):
+            drawn.append(circle(screen, color, center, radius))
+        # the disk of each target is drawn right before its rings so overlapping targets stack as before
+        rings = self.sprites.sprite
+        for color, (x, y), radius in zip(self.targets.color[:n_targets].tolist(),
+                                         target_coord.astype(np.int64).tolist(),
+                                         self.targets.radius[:n_targets].astype(np.int64).tolist()):
+            drawn.append(circle(screen, color, (x, y), radius))
+            drawn.append(screen.blit(rings("target", radius), (x - radius, y - radius)))
+        drawn += screen.blits(self.sprites.blit_list("bomb", bomb_coord.astype(np.int64).tolist(),
+                                                     self.bombs.radius[:n_bombs].astype(np.int64).tolist()))
+        if rects is None:
+            for gun, shell_type_index in self.tanks():
+                gun.draw(screen, shell_type_index)
+            self.score_table.draw(screen)
+            if self.profiler is not None:
+                self.profiler.draw(screen, self)
+            return
+        rects += drawn
+        for gun, shell_type_index in self.tanks():
+            rects.append(gun.draw(screen, shell_type_index))
+        rects += self.score_table.draw(screen)
+        if self.profiler is not None:
+            rects += self.profiler.draw(screen, self)
 
     def move(self):
         '''
         Runs shells' and gun's movement method, removes dead shells.
         :self
         '''
-        dead_shells = []
-        for i, shell in enumerate(self.shells):
-            shell.move(gravity=self.gravity)
-            if not shell.is_alive:
-                dead_shells.append(i)
-        for i in reversed(dead_shells):
-            self.shells.pop(i)
-        for i, target in enumerate(self.targets):
-            target.move()
-        for bomb in self.bombs:
-            bomb.move()
+        self.shells.move(gravity=self.gravity)
+        self.targets.move()
+        self.bombs.move()
         self.gun.gain()
         self.npc.gain(5)
         self.npc.move()
@@ -659,55 +2250,197 @@ class Manager:
         Checks whether shell bump into targets, sets shell' alive trigger.
         :self
         '''
-        # shell target collision
-        collisions: list[list[int]] = []
-        targets_collide: list[int] = []
-        for i, shell in enumerate(self.shells):
-            for j, target in enumerate(self.targets):
-                if target.check_collision(shell):
-                    collisions.append([i, j])
-                    targets_collide.append(j)
-                    
-        targets_collide.sort()
-        for target in reversed(targets_collide):
-            self.score_table.target_destroyed += 1
-            self.targets.pop(target)
-
-        for i, shell in enumerate(self.shells):
-            if shell.is_fired and self.gun.check_collision(shell):
-                self.shells.pop(i)
-                self.score_table.hit += 1
+        n = len(self.shells)
+        coord, radius = self.shells.coord[:n], self.shells.radius[:n]
+
+        # shell target collision, swept over the tick
+        n_targets = len(self.targets)
+        _, targets_collide, _ = swept_circle_pairs(self.shells.prev_coord[:n], coord, radius,
+                                                   self.targets.prev_coord[:n_targets], self.targets.coord[:n_targets],
+                                                   self.targets.radius[:n_targets], self.grid)
+        if len(targets_collide):
+            targets_keep = np.ones(len(self.targets), dtype=np.bool_)
+            targets_keep[targets_collide] = False
+            self.score_table.target_destroyed += len(self.targets) - int(np.count_nonzero(targets_keep))
+            self.targets.cull(targets_keep)
+
+        # fired shell tank collision
+        gun_coord = np.array([self.gun.coord], dtype=np.float64)
+        gun_radius = np.array([self.gun.radius], dtype=np.float64)
+        fired = np.flatnonzero(self.shells.is_fired[:n])
+        hits, _, _ = swept_circle_pairs(self.shells.prev_coord[:n][fired], coord[fired], radius[fired],
+                                        gun_coord, gun_coord, gun_radius, self.grid)
+        self.score_table.hit += len(hits)
+        gun_hits = np.zeros(n, dtype=np.bool_)
+        gun_hits[fired[hits]] = True
+        self.shells.cull(~gun_hits)
 
         # bomb tank collision
-        bombs_collide = []
-        for i, bomb in enumerate(self.bombs):
-            if bomb.check_collision(self.gun.get_rect()):
-                self.score_table.hit += 1
-                bombs_collide.append(bomb)
-        for bomb in bombs_collide:
-            self.bombs.remove(bomb)
-        
-def main() -> None:
+        n_bombs = len(self.bombs)
+        bomb_coord = self.bombs.coord[:n_bombs]
+        bomb_half = np.repeat(self.bombs.radius[:n_bombs, None], 2, axis=1)
+        center, half = self.gun.get_box()
+        tank_coord = np.array([center], dtype=np.float64)
+        tank_half = np.array([half], dtype=np.float64)
+        bombs_collide, _, _ = swept_box_pairs(self.bombs.prev_coord[:n_bombs], bomb_coord, bomb_half,
+                                              tank_coord, tank_half, self.grid)
+        if len(bombs_collide):
+            bombs_keep = np.ones(n_bombs, dtype=np.bool_)
+            bombs_keep[bombs_collide] = False
+            self.score_table.hit += len(bombs_collide)
+            self.bombs.cull(bombs_keep)
+
+def main(profile=False, dirty=False, physics_hz=30, max_fps=120, vsync=False, seed=None, record=None,
+         load=None, save=None, pipeline=False, capture=None, capture_policy="block", npc_aimer=None) -> None:
     '''
     Main function to initialize the screen and game runtime.
+    Physics runs at physics_hz ticks per second, rendering up to max_fps frames (0 for no limit).
+    With pipeline set, physics runs on its own thread and frames draw its latest published state.
+    With capture set, the screen is also encoded to that file by capture.py, one video frame per
+    physics tick at physics_hz, so the video plays at game speed whatever the render rate. The
+    encoder waits for or drops frames as capture_policy says when it falls behind.
+    With profile set, frame phases are timed and shown in an overlay.
+    With dirty set, only changed areas of the screen are redrawn and updated.
+    With record set, the game's inputs are saved to that file for replay.py.
+    With npc_aimer set, the NPC aims by Monte-Carlo lookahead with that many milliseconds per shot.
+    Load and save are snapshot files to continue from and to write on quit. If the game
+    crashes, its state is written to crash-<tick>.snap.
     '''
-    screen = pg.display.set_mode(SCREEN_SIZE)
+    pg.display.init()
+    screen = None
+    if vsync:
+        try:
+            screen = pg.display.set_mode(SCREEN_SIZE, pg.SCALED, vsync=1)
+        except pg.error:
+            pass
+    if screen is None:
+        screen = pg.display.set_mode(SCREEN_SIZE)
     pg.display.set_caption("The gun of Khiryanov")
 
     done = False
     clock = pg.time.Clock()
 
-    mgr = Manager(num_of_targets=3, gravity=2)
-
-    while not done:
-        clock.tick(30)
-        screen.fill(BLACK)
-
-        done = mgr.process(pg.event.get(), screen)
-
-        pg.display.flip()
-
+    params = {"num_of_targets": 3, "gravity": 2}
+    if seed is None:
+        seed = random.randrange(2**32)
+    if load is not None:
+        from snapshot import load as load_snapshot
+        mgr = load_snapshot(load)
+    else:
+        mgr = Manager(seed=seed, **params)
+    if record is not None:
+        from replay import Recorder
+        mgr.recorder = Recorder(seed, params)
+    if npc_aimer is not None:
+        mgr.npc_aimer = MonteCarloAimer(budget_ms=npc_aimer, seed=seed)
+    # the NPC's aiming tables, built before the first frame instead of on its first shot
+    ballistic_solver(mgr.gravity)
+    if profile:
+        mgr.profiler = FrameProfiler()
+    if dirty:
+        mgr.renderer = DirtyRectRenderer()
+    prof = mgr.profiler
+    capturer = None
+    if capture is not None:
+        from capture import FrameCapture
+        capturer = FrameCapture(capture, screen, physics_hz, policy=capture_policy)
+        captured_tick = mgr.tick
+    if pipeline:
+        loop = PipelinedLoop(mgr, physics_hz)
+        loop.start()
+    else:
+        loop = FixedTimestep(mgr, physics_hz)
+
+    try:
+        while not done:
+            frame_time = clock.tick(max_fps) / 1000
+            if prof is not None:
+                prof.start_frame()
+
+            events = pg.event.get()
+            if mgr.renderer is None:
+                screen.fill(BLACK)
+            elif any(event.type == pg.VIDEOEXPOSE for event in events):
+                mgr.renderer.invalidate()
+            action = mgr.read_input(events)
+            done = action.quit
+            if prof is not None:
+                prof.lap("handle_events")
+
+            if pipeline:
+                loop.submit(action)
+                frame, alpha = loop.take()
+            else:
+                frame, alpha = mgr, loop.advance(frame_time, action)
+            frame.draw(screen, alpha)
+            if prof is not None:
+                prof.lap("draw")
+
+            if mgr.renderer is None:
+                pg.display.flip()
+            else:
+                mgr.renderer.present()
+            if capturer is not None:
+                # a frame for every tick since the last grab: none on frames between ticks, repeats after substeps
+                for _ in range(frame.tick - captured_tick):
+                    capturer.grab(screen)
+                captured_tick = frame.tick
+            if prof is not None:
+                prof.lap("flip")
+                prof.end_frame()
+    except Exception:
+        if pipeline:
+            loop.stop()
+        # keep the state that led to the crash
+        from snapshot import save as save_snapshot
+        path = "crash-{}.snap".format(mgr.tick)
+        save_snapshot(mgr, path)
+        print("game state saved to", path)
+        raise
+    finally:
+        # flushes the frames captured so far even after a crash
+        if capturer is not None:
+            capturer.close()
+
+    if capturer is not None:
+        print(capturer.summary())
+    if pipeline:
+        loop.stop()
+        print("{} frames for {} ticks, {} dropped, {} duplicated".format(
+            loop.frames, loop.ticks, loop.dropped_frames, loop.duplicated_frames))
+    if mgr.recorder is not None:
+        mgr.recorder.save(record)
+    if save is not None:
+        from snapshot import save as save_snapshot
+        save_snapshot(mgr, save)
+    # the fonts go with pygame, a later main() in this process loads them again
+    _text_caches.clear()
     pg.quit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="The gun of Khiryanov")
+    parser.add_argument("--profile", action="store_true", help="show per-phase frame times")
+    parser.add_argument("--dirty", action="store_true", help="redraw only changed areas of the screen")
+    parser.add_argument("--physics-hz", type=int, default=30, help="physics ticks per second")
+    parser.add_argument("--max-fps", type=int, default=120, help="render frame limit, 0 for none")
+    parser.add_argument("--vsync", action="store_true", help="render in sync with the display")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the game, random by default")
+    parser.add_argument("--record", metavar="PATH", default=None, help="save the game's inputs for replay.py")
+    parser.add_argument("--load", metavar="PATH", default=None, help="continue the game saved in a snapshot")
+    parser.add_argument("--save", metavar="PATH", default=None, help="save a snapshot of the game on quit")
+    parser.add_argument("--pipeline", action="store_true", help="run physics on its own thread")
+    parser.add_argument("--capture", metavar="PATH", default=None, help="record the frames to .y4m, .png or .rgb")
+    parser.add_argument("--capture-policy", choices=["block", "drop"], default="block",
+                        help="wait for or drop frames when the encoder falls behind")
+    parser.add_argument("--npc-aimer", metavar="MS", type=float, default=None,
+                        help="let the NPC aim by lookahead simulation, with this time budget per shot")
+    args = parser.parse_args()
+    if args.load and args.record:
+        parser.error("--record replays from the start of a game, it can't be used with --load")
+    if args.npc_aimer is not None and args.record:
+        parser.error("the lookahead aimer stops on a time budget, games using it can't be replayed")
+    main(profile=args.profile, dirty=args.dirty, physics_hz=args.physics_hz,
+         max_fps=args.max_fps, vsync=args.vsync, seed=args.seed, record=args.record,
+         load=args.load, save=args.save, pipeline=args.pipeline, capture=args.capture,
+         capture_policy=args.capture_policy, npc_aimer=args.npc_aimer)
@@ -0,0 +1,330 @@
+'''
+Frame capture and video export for games and headless simulations.
+
+FrameCapture.grab copies the screen's pixel rows as they are, through a
+zero-copy Surface.get_view buffer, into one of a fixed set of preallocated frame
+buffers and queues it: a single memcpy on the game's thread. A worker thread
+picks the RGB channels out of the pixels, encodes the frame to a PNG sequence,
+a Y4M stream (4:2:0, plays in ffmpeg, mpv and VLC) or raw RGB24 and hands the
+buffer back. When all buffers are in use, grab either waits for the worker
+("block", no frame lost) or skips the copy ("drop", the game never waits) and
+the previous frame is written again in its place, so the video keeps its
+length and plays at the right speed. The time grab takes on the calling
+thread is the capture overhead reported per frame.
+
+    python cannon.py --capture game.y4m
+    python capture.py sim.y4m --seed 3 --ticks 900
+    python capture.py frames/frame.png --replay game.rpl --policy drop
+    python capture.py - --ticks 300 | ffmpeg -i - game.mp4
+'''
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+# the greeting would end up in a video streamed to standard output
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import queue
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pygame as pg
+
+import cannon
+
+POLICIES = ("block", "drop")
+# frames whose grab and encode times are kept for the summary
+SAMPLES = 4096
+
+
+class PngSequence:
+    '''
+    Writes every frame to its own PNG file. The path gets the frame number before its extension
+    unless it has a format field of its own, like "frames/{:06d}.png".
+    '''
+    def __init__(self, path, size, fps=30):
+        '''
+        Constructor method.
+        :self, path, size, fps
+        '''
+        if "{" not in path:
+            root, ext = os.path.splitext(path)
+            path = root + "-{:06d}" + ext
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.pattern = path
+        self.size = size
+        self.last = None
+
+    def write(self, index, frame):
+        surface = pg.image.frombuffer(frame, self.size, "RGB")
+        self.last = self.pattern.format(index)
+        pg.image.save(surface, self.last)
+
+    def repeat(self, index):
+        '''
+        Writes the last frame again as frame `index`.
+        :self, index
+        '''
+        if self.last is not None:
+            shutil.copyfile(self.last, self.pattern.format(index))
+
+    def close(self):
+        pass
+
+
+class RawWriter:
+    '''
+    Writes frames as bare RGB24 pixels, one after another. "-" writes to standard output.
+    ffmpeg reads them with -f rawvideo -pix_fmt rgb24 -s WxH.
+    '''
+    def __init__(self, path, size, fps=30):
+        '''
+        Constructor method.
+        :self, path, size, fps
+        '''
+        if path != "-" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.out = sys.stdout.buffer if path == "-" else open(path, "wb")
+        self.size = size
+        self.last = None
+
+    def write(self, index, frame):
+        # the frame buffer is only refilled for the next frame, after any repeats of this one
+        self.last = [frame]
+        self.out.write(frame.data)
+
+    def repeat(self, index):
+        '''
+        Writes the last frame again.
+        :self, index
+        '''
+        if self.last is not None:
+            for data in self.last:
+                self.out.write(memoryview(data))
+
+    def close(self):
+        self.out.flush()
+        if self.out is not sys.stdout.buffer:
+            self.out.close()
+
+
+class Y4MWriter(RawWriter):
+    '''
+    Writes a YUV4MPEG2 stream with full range BT.601 colors and 4:2:0 chroma, so it plays
+    and converts without being told the frame size. "-" writes to standard output.
+    '''
+    def __init__(self, path, size, fps=30):
+        '''
+        Constructor method. Width and height must be even.
+        :self, path, size, fps
+        '''
+        width, height = size
+        if width % 2 or height % 2:
+            raise ValueError("Y4M 4:2:0 needs an even frame size, not {}x{}".format(width, height))
+        super().__init__(path, size, fps)
+        self.out.write("YUV4MPEG2 W{} H{} F{}:1 Ip A1:1 C420jpeg XCOLORRANGE=FULL\n".format(
+            width, height, fps).encode())
+        self.planes = np.empty((3, height, width), dtype=np.int32)
+
+    def write(self, index, frame):
+        # fixed point in 1/256, about four times faster than floats and off by at most one
+        planes = self.planes
+        np.copyto(planes, np.moveaxis(frame, 2, 0))
+        r, g, b = planes
+        y = (77*r + 150*g + 29*b + 128) >> 8
+        # chroma of every 2x2 block from the sum of its pixels
+        r4, g4, b4 = planes[:, 0::2, 0::2] + planes[:, 1::2, 0::2] + planes[:, 0::2, 1::2] + planes[:, 1::2, 1::2]
+        cb = ((-43*r4 - 85*g4 + 128*b4 + 512) >> 10) + 128
+        cr = ((128*r4 - 107*g4 - 21*b4 + 512) >> 10) + 128
+        self.last = [b"FRAME\n", y.astype(np.uint8), np.clip(cb, 0, 255).astype(np.uint8),
+                     np.clip(cr, 0, 255).astype(np.uint8)]
+        for data in self.last:
+            self.out.write(memoryview(data))
+
+
+ENCODERS = {
+    ".png": PngSequence,
+    ".y4m": Y4MWriter,
+    ".rgb": RawWriter,
+    ".raw": RawWriter,
+}
+
+
+def encoder_for(path, size, fps=30):
+    '''
+    Encoder for the file's extension. "-" streams Y4M to standard output.
+    :path, size, fps
+    '''
+    ext = ".y4m" if path == "-" else os.path.splitext(path)[1].lower()
+    if ext not in ENCODERS:
+        raise ValueError("can't capture to {!r}, use one of {}".format(path, ", ".join(ENCODERS)))
+    return ENCODERS[ext](path, size, fps)
+
+
+class FrameCapture:
+    '''
+    Captures frames of surfaces shaped like the given one into a fixed set of buffers that
+    a worker thread encodes. At most `buffers` frames wait for the encoder, so memory stays
+    bounded whatever the policy; a dropped frame only queues a marker to repeat the last one.
+    Every grab is one frame of the video at `fps`.
+    '''
+    def __init__(self, path, surface, fps=30, buffers=8, policy="block"):
+        '''
+        Constructor method. Surfaces need 24 or 32 bits per pixel, like every display surface.
+        :self, path, surface, fps, buffers, policy
+        '''
+        if policy not in POLICIES:
+            raise ValueError("policy must be one of {}, not {!r}".format(", ".join(POLICIES), policy))
+        bytesize = surface.get_bytesize()
+        if bytesize not in (3, 4):
+            raise ValueError("can't capture {}-bit surfaces".format(surface.get_bitsize()))
+        self.path = path
+        self.size = surface.get_size()
+        self.policy = policy
+        # byte of each color channel within a pixel
+        self.channels = [shift // 8 if sys.byteorder == "little" else bytesize - 1 - shift // 8
+                         for shift in surface.get_shifts()[:3]]
+        self.bytesize = bytesize
+        self.encoder = encoder_for(path, self.size, fps)
+        width, height = self.size
+        self.rgb = np.empty((height, width, 3), dtype=np.uint8)
+        self.free = queue.Queue()
+        for _ in range(buffers):
+            self.free.put(np.empty((height, surface.get_pitch()), dtype=np.uint8))
+        self.frames = queue.Queue()
+        self.captured = 0
+        self.dropped = 0
+        self.grab_ns = deque(maxlen=SAMPLES)
+        self.encode_ns = deque(maxlen=SAMPLES)
+        self.error = None
+        self.worker = threading.Thread(target=self.run, name="capture", daemon=True)
+        self.worker.start()
+
+    def grab(self, surface):
+        '''
+        Queues a copy of the surface for encoding. Returns False if the frame was dropped and
+        the previous one is repeated instead.
+        :self, surface
+        '''
+        if self.error is not None:
+            raise self.error
+        start = time.perf_counter_ns()
+        try:
+            frame = self.free.get(block=self.policy == "block")
+        except queue.Empty:
+            self.frames.put((self.captured, None))
+            self.captured += 1
+            self.dropped += 1
+            self.grab_ns.append(time.perf_counter_ns() - start)
+            return False
+        view = surface.get_view("0")
+        np.copyto(frame, np.frombuffer(view, dtype=np.uint8).reshape(frame.shape))
+        # the view keeps the surface locked
+        del view
+        self.frames.put((self.captured, frame))
+        self.captured += 1
+        self.grab_ns.append(time.perf_counter_ns() - start)
+        return True
+
+    def run(self):
+        '''
+        Worker thread: encodes queued frames in order and hands their buffers back. Dropped
+        frames repeat the last one. After an error it keeps handing buffers back so a blocking
+        grab can't hang.
+        :self
+        '''
+        clock = time.perf_counter_ns
+        while True:
+            item = self.frames.get()
+            if item is None:
+                return
+            index, frame = item
+            if frame is None:
+                if self.error is None:
+                    try:
+                        self.encoder.repeat(index)
+                    except Exception as error:
+                        self.error = error
+                continue
+            if self.error is None:
+                start = clock()
+                width, height = self.size
+                try:
+                    pixels = frame[:, :width * self.bytesize].reshape(height, width, self.bytesize)
+                    for i, channel in enumerate(self.channels):
+                        self.rgb[..., i] = pixels[..., channel]
+                    self.encoder.write(index, self.rgb)
+                except Exception as error:
+                    self.error = error
+                self.encode_ns.append(clock() - start)
+            self.free.put(frame)
+
+    def close(self):
+        '''
+        Waits until all queued frames are encoded and closes the output.
+        :self
+        '''
+        self.frames.put(None)
+        self.worker.join()
+        self.encoder.close()
+        if self.error is not None:
+            raise self.error
+
+    def summary(self):
+        '''
+        One line report of the capture: frames, drops and per-frame times in milliseconds
+        over the last SAMPLES frames.
+        :self
+        '''
+        def percentiles(samples):
+            if not samples:
+                return "-"
+            ordered = sorted(samples)
+            return "p50 {:.3f} p99 {:.3f} max {:.3f} ms".format(
+                ordered[len(ordered) // 2] / 1e6, ordered[min(len(ordered) - 1, len(ordered) * 99 // 100)] / 1e6,
+                ordered[-1] / 1e6)
+        return "captured {} frames to {}, {} dropped and filled with the previous one, grab {}, encode {}".format(
+            self.captured, self.path, self.dropped, percentiles(self.grab_ns), percentiles(self.encode_ns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="output: .png sequence, .y4m, .rgb/.raw, or - for Y4M on standard output")
+    parser.add_argument("--replay", metavar="PATH", default=None, help="replay file to render instead of an idle game")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the game without --replay")
+    parser.add_argument("--ticks", type=int, default=900, help="ticks to render, at most the whole replay")
+    parser.add_argument("--fps", type=int, default=30, help="frame rate of the video, one frame per tick")
+    parser.add_argument("--buffers", type=int, default=8, help="frames that can wait for the encoder")
+    parser.add_argument("--policy", choices=POLICIES, default="block", help="when the encoder falls behind")
+    args = parser.parse_args(argv)
+
+    if args.replay is not None:
+        import replay
+        recorded = replay.load(args.replay)
+        mgr = recorded.seek(0)
+        actions = [recorded.log[tick] for tick in range(min(args.ticks, len(recorded)))]
+    else:
+        mgr = cannon.Manager(num_of_targets=3, seed=args.seed)
+        actions = [cannon.Action()] * args.ticks
+
+    screen = pg.Surface(cannon.SCREEN_SIZE)
+    capture = FrameCapture(args.path, screen, args.fps, args.buffers, args.policy)
+    start = time.perf_counter()
+    for action in actions:
+        mgr.step(action)
+        mgr.draw(screen)
+        capture.grab(screen)
+    capture.close()
+    print("{} ticks in {:.2f} s".format(len(actions), time.perf_counter() - start), file=sys.stderr)
+    print(capture.summary(), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,681 @@
+'''
+Local-network multiplayer: several cannons shooting at the targets and at each other.
+
+The server is authoritative. It runs an Arena, a Manager with one cannon per connected
+client, at a fixed tick rate over asyncio TCP. Clients send their actions, packed the
+same way as in replay.py, and receive the game state as updates.
+
+Updates are deltas. Shells, bombs and targets move deterministically with their store's
+move method, so clients move their copy of the state themselves. An update only carries
+the rows spawned since the last tick, the uids of removed rows and the players whose
+cannon or score changed, so its size depends on what changed and not on how many
+entities there are. A client that joins gets the full state once.
+
+    python netplay.py server --port 5555
+    python netplay.py client --port 5555        # one window per player
+    python netplay.py bench --clients 8 --ticks 300 --targets 5000
+'''
+import os
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import asyncio
+import collections
+import struct
+import sys
+import time
+
+import numpy as np
+import pygame as pg
+
+import cannon
+from replay import pack_action, unpack_action
+from snapshot import CANNON, pack_cannon, unpack_cannon
+
+WELCOME, UPDATE, INPUT = 1, 2, 3
+# length of the message that follows
+FRAME = struct.Struct("<I")
+# type, player uid, tick, target tick, gravity
+WELCOME_HEADER = struct.Struct("<Bqqqd")
+# type, tick, target tick, server clock when sent (ns)
+UPDATE_HEADER = struct.Struct("<Bqqq")
+COUNTS = struct.Struct("<II")
+STORES = ['shells', 'targets', 'bombs']
+
+PLAYER = np.dtype([
+    ('uid', '<i8'),
+    ('cannon', CANNON),
+    ('shell_type_index', '<i8'),
+    ('target_destroyed', '<i8'),
+    ('shell_used', '<i8'),
+    ('hit', '<i8'),
+    ('landed', '<i8'),
+])
+
+
+class Player:
+    '''
+    A connected cannon with its own score table and the input sent since the last tick.
+    '''
+    def __init__(self, uid, gun):
+        '''
+        Constructor method.
+        :self, uid, gun
+        '''
+        self.uid = uid
+        self.gun = gun
+        self.shell_type_index = 0
+        self.score_table = cannon.ScoreTable()
+        self.landed = 0 # shells that hit another player's cannon
+        self.pending = None
+        self.held = cannon.Action()
+
+    def submit(self, action):
+        '''
+        Queues an action for the next tick, merged with the ones queued before.
+        :self, action
+        '''
+        self.pending = action if self.pending is None else self.pending.merge(action)
+
+    def take_action(self):
+        '''
+        Action for this tick. Without new input, aim and direction of the last one are held.
+        Switches queued by the last one come first.
+        :self
+        '''
+        action = self.held if self.pending is None else self.held.merge(self.pending)
+        self.pending = None
+        self.held = action.held()
+        return action
+
+    def record(self):
+        '''
+        The player's cannon and score as a PLAYER record.
+        :self
+        '''
+        record = np.zeros(1, dtype=PLAYER)
+        record['uid'] = self.uid
+        pack_cannon(record['cannon'][0], self.gun)
+        record['shell_type_index'] = self.shell_type_index
+        record['target_destroyed'] = self.score_table.target_destroyed
+        record['shell_used'] = self.score_table.shell_used
+        record['hit'] = self.score_table.hit
+        record['landed'] = self.landed
+        return record
+
+    def load(self, record):
+        '''
+        Takes over cannon and score from a PLAYER record.
+        :self, record
+        '''
+        unpack_cannon(record['cannon'], self.gun)
+        self.shell_type_index = int(record['shell_type_index'])
+        self.score_table.target_destroyed = int(record['target_destroyed'])
+        self.score_table.shell_used = int(record['shell_used'])
+        self.score_table.hit = int(record['hit'])
+        self.landed = int(record['landed'])
+
+
+class Arena(cannon.Manager):
+    '''
+    Manager for several player cannons instead of the gun and the NPC. Shells carry their
+    player's uid as tag. A cannon is hit by other players' shells in flight and, as in the
+    single player game, by rolling shells of anyone.
+    '''
+    def __init__(self, seed=None, **params):
+        '''
+        Constructor method. Params are the ones of Manager.
+        :self, seed, params
+        '''
+        super().__init__(seed=seed, **params)
+        self.players = {}
+        self.next_player = 1
+
+    def join(self):
+        '''
+        Adds a player with a new cannon somewhere on the ground. Returns the player.
+        :self
+        '''
+        gun = cannon.Cannon(coord=[self.rng.randint(60, cannon.SCREEN_SIZE[0] - 60), cannon.SCREEN_SIZE[1] - 30],
+                            color=cannon.rand_color(self.rng))
+        player = Player(self.next_player, gun)
+        self.players[player.uid] = player
+        self.next_player += 1
+        return player
+
+    def leave(self, uid):
+        self.players.pop(uid, None)
+
+    def tanks(self):
+        return [(player.gun, player.shell_type_index) for player in self.players.values()]
+
+    def apply_action(self, action):
+        '''
+        Applies the actions the players submitted since the last tick. The Manager's own
+        action is ignored, there is no local gun.
+        :self, action
+        '''
+        for player in self.players.values():
+            action = player.take_action()
+            gun = player.gun
+            if action.charge:
+                gun.activate()
+            if action.fire:
+                i = gun.strike(self.shell_types[player.shell_type_index], self.shells, self.rng)
+                self.shells.tag[i] = player.uid
+                player.score_table.shell_used += 1
+            if action.switch:
+                player.shell_type_index = (player.shell_type_index + 1) % len(self.shell_types)
+            if action.direction:
+                gun.move(10 * action.direction)
+            if action.aim is not None:
+                gun.set_angle(action.aim)
+
+    def move(self):
+        '''
+        Moves shells, targets and bombs, charges the players' cannons.
+        :self
+        '''
+        self.shells.move(gravity=self.gravity)
+        self.targets.move()
+        self.bombs.move()
+        for player in self.players.values():
+            player.gun.gain()
+
+    def collide(self):
+        '''
+        Shells destroy targets, the player of the shell that reaches a target first in the tick scores it.
+        Shells and bombs hit the players' cannons.
+        :self
+        '''
+        shells = self.shells
+        n = len(shells)
+        coord, radius, owner = shells.coord[:n], shells.radius[:n], shells.tag[:n]
+
+        n_targets = len(self.targets)
+        by_shell, hit_targets, toi = cannon.swept_circle_pairs(
+            shells.prev_coord[:n], coord, radius, self.targets.prev_coord[:n_targets],
+            self.targets.coord[:n_targets], self.targets.radius[:n_targets], self.grid)
+        if len(hit_targets):
+            order = np.lexsort((toi, hit_targets))
+            destroyed, first = np.unique(hit_targets[order], return_index=True)
+            for uid in owner[by_shell[order[first]]].tolist():
+                if uid in self.players:
+                    self.players[uid].score_table.target_destroyed += 1
+            self.score_table.target_destroyed += len(destroyed)
+            keep = np.ones(n_targets, dtype=np.bool_)
+            keep[destroyed] = False
+            self.targets.cull(keep)
+
+        players = list(self.players.values())
+        if not players:
+            return
+        uids = np.array([player.uid for player in players], dtype=np.int64)
+        gun_coord = np.array([player.gun.coord for player in players], dtype=np.float64)
+        gun_radius = np.array([player.gun.radius for player in players], dtype=np.float64)
+        hitting, hit_guns, _ = cannon.swept_circle_pairs(shells.prev_coord[:n], coord, radius,
+                                                         gun_coord, gun_coord, gun_radius, self.grid)
+        valid = shells.is_fired[:n][hitting] | (owner[hitting] != uids[hit_guns])
+        hitting, hit_guns = hitting[valid], hit_guns[valid]
+        if len(hitting):
+            for uid, i in zip(owner[hitting].tolist(), hit_guns.tolist()):
+                players[i].score_table.hit += 1
+                if uid != players[i].uid and uid in self.players:
+                    self.players[uid].landed += 1
+            self.score_table.hit += len(hitting)
+            keep = np.ones(n, dtype=np.bool_)
+            keep[hitting] = False
+            shells.cull(keep)
+
+        n_bombs = len(self.bombs)
+        tanks = [player.gun.get_box() for player in players]
+        tank_coord = np.array([center for center, _ in tanks], dtype=np.float64)
+        tank_half = np.array([half for _, half in tanks], dtype=np.float64)
+        bombing, bombed, _ = cannon.swept_box_pairs(self.bombs.prev_coord[:n_bombs], self.bombs.coord[:n_bombs],
+                                                    np.repeat(self.bombs.radius[:n_bombs, None], 2, axis=1),
+                                                    tank_coord, tank_half, self.grid)
+        if len(bombing):
+            for i in bombed.tolist():
+                players[i].score_table.hit += 1
+            self.score_table.hit += len(bombing)
+            keep = np.ones(n_bombs, dtype=np.bool_)
+            keep[bombing] = False
+            self.bombs.cull(keep)
+
+    def sync_player(self, record):
+        '''
+        Client side: creates or updates a player from a PLAYER record.
+        :self, record
+        '''
+        uid = int(record['uid'])
+        if uid not in self.players:
+            self.players[uid] = Player(uid, cannon.Cannon())
+        self.players[uid].load(record)
+
+
+def pack_rows(store, start, stop):
+    '''
+    Rows [start, stop) of a store, field after field.
+    :store, start, stop
+    '''
+    return b"".join(np.ascontiguousarray(getattr(store, field)[start:stop]).tobytes() for field in store.fields)
+
+
+def unpack_rows(store, data, offset, count):
+    '''
+    Appends count rows packed by pack_rows to the store, uids included. Returns the offset after them.
+    :store, data, offset, count
+    '''
+    store.reserve(count)
+    rows = slice(store.size, store.size + count)
+    for field, (dtype, shape) in store.fields.items():
+        block = np.frombuffer(data, dtype=dtype, count=count * int(np.prod(shape, dtype=np.int64)), offset=offset)
+        getattr(store, field)[rows] = block.reshape((count,) + shape)
+        offset += block.nbytes
+    store.size += count
+    return offset
+
+
+class Sync:
+    '''
+    Server side: tracks what changed in an arena since the last update. New rows are the ones
+    with uids from each store's watermark on, at the end of the store as rows keep their order.
+    Removed uids are collected by the stores. Player records are compared with the last sent.
+    '''
+    def __init__(self, arena):
+        '''
+        Constructor method.
+        :self, arena
+        '''
+        self.arena = arena
+        self.watermark = {}
+        for name in STORES:
+            store = getattr(arena, name)
+            store.removed = []
+            self.watermark[name] = store.next_uid
+        self.sent_players = {}
+
+    def full(self, uid):
+        '''
+        Welcome message for the player with the given uid: the whole current state.
+        :self, uid
+        '''
+        arena = self.arena
+        parts = [WELCOME_HEADER.pack(WELCOME, uid, arena.tick, arena.targets.tick, arena.gravity)]
+        for name in STORES:
+            store = getattr(arena, name)
+            parts.append(COUNTS.pack(len(store), 0))
+            parts.append(pack_rows(store, 0, len(store)))
+        records = [player.record() for player in arena.players.values()]
+        parts.append(COUNTS.pack(len(records), 0))
+        parts += [record.tobytes() for record in records]
+        return b"".join(parts)
+
+    def update(self):
+        '''
+        Update message with everything that changed since the last one.
+        :self
+        '''
+        arena = self.arena
+        parts = [UPDATE_HEADER.pack(UPDATE, arena.tick, arena.targets.tick, time.monotonic_ns())]
+        for name in STORES:
+            store = getattr(arena, name)
+            n = len(store)
+            start = int(np.searchsorted(store.uid[:n], self.watermark[name]))
+            self.watermark[name] = store.next_uid
+            removed = np.concatenate(store.removed) if store.removed else np.zeros(0, dtype=np.int64)
+            store.removed.clear()
+            parts.append(COUNTS.pack(n - start, len(removed)))
+            parts.append(pack_rows(store, start, n))
+            parts.append(removed.astype(np.int64).tobytes())
+
+        changed = []
+        for uid, player in arena.players.items():
+            packed = player.record().tobytes()
+            if self.sent_players.get(uid) != packed:
+                self.sent_players[uid] = packed
+                changed.append(packed)
+        left = [uid for uid in self.sent_players if uid not in arena.players]
+        for uid in left:
+            del self.sent_players[uid]
+        parts.append(COUNTS.pack(len(changed), len(left)))
+        parts += changed
+        parts.append(np.array(left, dtype=np.int64).tobytes())
+        return b"".join(parts)
+
+
+def apply_full(data):
+    '''
+    Client side: builds the arena from a welcome message. Returns the arena and the player's uid.
+    :data
+    '''
+    _, uid, tick, target_tick, gravity = WELCOME_HEADER.unpack_from(data)
+    arena = Arena(gravity=gravity)
+    arena.tick = tick
+    offset = WELCOME_HEADER.size
+    for name in STORES:
+        store = type(getattr(arena, name))()
+        count, _ = COUNTS.unpack_from(data, offset)
+        offset = unpack_rows(store, data, offset + COUNTS.size, count)
+        setattr(arena, name, store)
+    arena.targets.tick = target_tick
+    count, _ = COUNTS.unpack_from(data, offset)
+    offset += COUNTS.size
+    for record in np.frombuffer(data, dtype=PLAYER, count=count, offset=offset):
+        arena.sync_player(record)
+    if uid in arena.players:
+        arena.score_table = arena.players[uid].score_table
+    return arena, uid
+
+
+def apply_update(arena, data):
+    '''
+    Client side: moves the arena one tick and applies an update. Returns the server clock of the update.
+    :arena, data
+    '''
+    _, tick, target_tick, sent_ns = UPDATE_HEADER.unpack_from(data)
+    arena.shells.move(gravity=arena.gravity)
+    arena.targets.tick = target_tick - 1
+    arena.targets.move()
+    arena.bombs.move()
+    offset = UPDATE_HEADER.size
+    for name in STORES:
+        store = getattr(arena, name)
+        spawned, removed = COUNTS.unpack_from(data, offset)
+        offset += COUNTS.size
+        rows_at = offset
+        offset += spawned * sum(np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64))
+                                for dtype, shape in store.fields.values())
+        if removed:
+            gone = np.frombuffer(data, dtype=np.int64, count=removed, offset=offset)
+            store.cull(~np.isin(store.uid[:len(store)], gone))
+            offset += gone.nbytes
+        unpack_rows(store, data, rows_at, spawned)
+
+    changed, left = COUNTS.unpack_from(data, offset)
+    offset += COUNTS.size
+    for record in np.frombuffer(data, dtype=PLAYER, count=changed, offset=offset):
+        arena.sync_player(record)
+    offset += changed * PLAYER.itemsize
+    for uid in np.frombuffer(data, dtype=np.int64, count=left, offset=offset).tolist():
+        arena.leave(uid)
+    arena.tick = tick
+    return sent_ns
+
+
+class NetStats:
+    '''
+    Bandwidth and tick latency counters. Time samples of the last `size` ticks are kept.
+    '''
+    def __init__(self, size=1024):
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.messages_sent = 0
+        self.messages_received = 0
+        self.started = time.perf_counter()
+        self.tick_ns = collections.deque(maxlen=size) # server: step and encoding time
+        self.lag_ns = collections.deque(maxlen=size) # server: how late the tick started
+        self.latency_ns = collections.deque(maxlen=size) # client: from sending the update to applying it
+
+    def sent(self, size, count=1):
+        self.bytes_sent += (size + FRAME.size) * count
+        self.messages_sent += count
+
+    def received(self, size):
+        self.bytes_received += size + FRAME.size
+        self.messages_received += 1
+
+    @staticmethod
+    def percentiles(samples):
+        ordered = sorted(samples)
+        if not ordered:
+            return 0.0, 0.0
+        return ordered[len(ordered) // 2] / 1e6, ordered[min(len(ordered) - 1, len(ordered) * 99 // 100)] / 1e6
+
+    def summary(self):
+        '''
+        One line with the counters: totals, rates and p50/p99 of the time samples in ms.
+        :self
+        '''
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        line = "sent {:.1f} kB ({:.1f} kB/s, {} msgs), received {:.1f} kB ({:.1f} kB/s, {} msgs)".format(
+            self.bytes_sent / 1e3, self.bytes_sent / 1e3 / elapsed, self.messages_sent,
+            self.bytes_received / 1e3, self.bytes_received / 1e3 / elapsed, self.messages_received)
+        for name, samples in (("tick", self.tick_ns), ("lag", self.lag_ns), ("latency", self.latency_ns)):
+            if samples:
+                line += ", {} p50 {:.2f} p99 {:.2f} ms".format(name, *self.percentiles(samples))
+        return line
+
+
+async def read_frame(reader):
+    '''
+    Reads one length-prefixed message, None when the connection is closed.
+    :reader
+    '''
+    try:
+        header = await reader.readexactly(FRAME.size)
+        return await reader.readexactly(FRAME.unpack(header)[0])
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+def write_frame(writer, data):
+    writer.writelines([FRAME.pack(len(data)), data])
+
+
+class Server:
+    '''
+    Runs an arena at a fixed tick rate and keeps the connected clients in sync.
+    '''
+    def __init__(self, arena, tick_rate=30):
+        '''
+        Constructor method.
+        :self, arena, tick_rate
+        '''
+        self.arena = arena
+        self.sync = Sync(arena)
+        self.dt = 1 / tick_rate
+        self.writers = {}
+        self.stats = NetStats()
+
+    async def handle(self, reader, writer):
+        '''
+        Serves one client: a new player, the welcome message, then its inputs until it leaves.
+        :self, reader, writer
+        '''
+        player = self.arena.join()
+        welcome = self.sync.full(player.uid)
+        write_frame(writer, welcome)
+        self.stats.sent(len(welcome))
+        self.writers[player.uid] = writer
+        try:
+            while True:
+                data = await read_frame(reader)
+                if data is None:
+                    break
+                self.stats.received(len(data))
+                if data[0] == INPUT:
+                    player.submit(unpack_action(data, 1))
+        finally:
+            self.writers.pop(player.uid, None)
+            self.arena.leave(player.uid)
+            writer.close()
+
+    async def run(self, ticks=None):
+        '''
+        Steps the arena and sends updates at the tick rate, for the given number of ticks or forever.
+        :self, ticks
+        '''
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        for _ in iter(int, 1) if ticks is None else range(ticks):
+            next_tick += self.dt
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            self.stats.lag_ns.append(max(0, int((loop.time() - next_tick) * 1e9)))
+            start = time.perf_counter_ns()
+            self.arena.step()
+            update = self.sync.update()
+            writers = list(self.writers.values())
+            for writer in writers:
+                write_frame(writer, update)
+            self.stats.sent(len(update), len(writers))
+            self.stats.tick_ns.append(time.perf_counter_ns() - start)
+            await asyncio.gather(*(writer.drain() for writer in writers), return_exceptions=True)
+
+
+class Client:
+    '''
+    Connects to a server and keeps a copy of its arena up to date.
+    '''
+    def __init__(self):
+        self.arena = None
+        self.uid = None
+        self.reader = None
+        self.writer = None
+        self.stats = NetStats()
+
+    async def connect(self, host, port):
+        '''
+        Connects and waits for the welcome message.
+        :self, host, port
+        '''
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        data = await read_frame(self.reader)
+        self.stats.received(len(data))
+        self.arena, self.uid = apply_full(data)
+
+    def send(self, action):
+        data = bytes([INPUT]) + pack_action(action)
+        write_frame(self.writer, data)
+        self.stats.sent(len(data))
+
+    async def receive(self):
+        '''
+        Applies updates until the server closes the connection.
+        :self
+        '''
+        while True:
+            data = await read_frame(self.reader)
+            if data is None:
+                return
+            self.stats.received(len(data))
+            sent_ns = apply_update(self.arena, data)
+            # both ends read the same monotonic clock on one machine
+            self.stats.latency_ns.append(time.monotonic_ns() - sent_ns)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def serve(host, port, tick_rate, seed, report=5.0):
+    arena = Arena(seed=seed, num_of_targets=3)
+    server = Server(arena, tick_rate)
+    listener = await asyncio.start_server(server.handle, host, port)
+    print("serving on {}:{}".format(host, port))
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(report)
+            print("tick {} players {}: {}".format(arena.tick, len(arena.players), server.stats.summary()))
+
+    async with listener:
+        await asyncio.gather(server.run(), reporter())
+
+
+async def play(host, port, max_fps=60):
+    '''
+    Client with a window: mouse and keyboard drive this player's cannon.
+    '''
+    client = Client()
+    await client.connect(host, port)
+    screen = pg.display.set_mode(cannon.SCREEN_SIZE)
+    pg.display.set_caption("The gun of Khiryanov, player {}".format(client.uid))
+    receiving = asyncio.ensure_future(client.receive())
+    try:
+        while not receiving.done():
+            action = client.arena.read_input(pg.event.get())
+            if action.quit:
+                break
+            client.send(action)
+            client.arena.draw(screen)
+            pg.display.flip()
+            await asyncio.sleep(1 / max_fps)
+    finally:
+        receiving.cancel()
+        client.close()
+        print(client.stats.summary())
+        pg.quit()
+
+
+async def bench(clients, ticks, tick_rate, targets, bomb_chance=0.005, seed=0):
+    '''
+    Server and bot clients in one process. Checks that every client's copy matches the server.
+    '''
+    import random
+    arena = Arena(seed=seed, num_of_targets=3, bomb_chance=bomb_chance)
+    for _ in range(targets):
+        arena.targets.append(cannon.Target(rng=arena.rng))
+    server = Server(arena, tick_rate)
+    listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    bots = [Client() for _ in range(clients)]
+    for bot in bots:
+        await bot.connect("127.0.0.1", port)
+    receivers = [asyncio.ensure_future(bot.receive()) for bot in bots]
+    rng = random.Random(seed)
+
+    async def drive():
+        for tick in range(ticks):
+            for bot in bots:
+                bot.send(cannon.Action(aim=(rng.randint(0, cannon.SCREEN_SIZE[0]), rng.randint(0, 300)),
+                                       charge=tick % 20 == 0, fire=tick % 20 == 10, direction=rng.randint(-1, 1)))
+            await asyncio.sleep(1 / tick_rate)
+
+    async with listener:
+        await asyncio.gather(server.run(ticks), drive())
+        await asyncio.sleep(0.2)
+    for bot in bots:
+        bot.close()
+    await asyncio.gather(*receivers, return_exceptions=True)
+
+    print("server: {}".format(server.stats.summary()))
+    print("bytes per message: {:.0f}, state {} shells {} targets {} bombs".format(
+        (server.stats.bytes_sent / max(1, server.stats.messages_sent)), len(arena.shells), len(arena.targets), len(arena.bombs)))
+    in_sync = 0
+    for bot in bots:
+        mirror = bot.arena
+        same = mirror.tick == arena.tick and all(
+            np.array_equal(getattr(mirror, name).uid[:len(getattr(mirror, name))], getattr(arena, name).uid[:len(getattr(arena, name))])
+            and np.array_equal(getattr(mirror, name).coord[:len(getattr(mirror, name))], getattr(arena, name).coord[:len(getattr(arena, name))])
+            for name in STORES)
+        in_sync += same
+    print("client: {}".format(bots[0].stats.summary()))
+    print("{} of {} clients in sync with the server".format(in_sync, len(bots)))
+    return 0 if in_sync == len(bots) else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["server", "client", "bench"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--tick-rate", type=int, default=30, help="server ticks per second")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--clients", type=int, default=4, help="bench: bot clients")
+    parser.add_argument("--ticks", type=int, default=300, help="bench: ticks to run")
+    parser.add_argument("--targets", type=int, default=0, help="bench: extra static targets")
+    parser.add_argument("--bomb-chance", type=float, default=0.005, help="bench: chance of a bomb per target and tick")
+    args = parser.parse_args(argv)
+
+    if args.mode == "server":
+        asyncio.run(serve(args.host, args.port, args.tick_rate, args.seed))
+    elif args.mode == "client":
+        asyncio.run(play(args.host, args.port))
+    else:
+        return asyncio.run(bench(args.clients, args.ticks, args.tick_rate, args.targets, args.bomb_chance, args.seed or 0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+'''
+Low resolution image observations of cannon games, for agents and analytics.
+
+ObservationRenderer rasterizes targets, shells, bombs and cannons straight
+into a small NumPy buffer, 84x84 by default, without pygame or the 800x600
+screen: every entity is stamped as the ellipse (circles) or box (cannons)
+it covers after scaling, a few dozen pixels each, as a batch over all
+entities of all games. The buffer has shape (games, channels, height,
+width), uint8, with one channel per entity type or a single grayscale
+channel with one gray level per type. It is reused by every render call and
+returned without a copy.
+
+    renderer = ObservationRenderer((84, 84))
+    pixels = renderer.render([mgr1, mgr2])      # Managers, or
+    pixels = renderer.render(vec_env)           # every game of a VecEnv
+
+    python observe.py --envs 4096 --ticks 50
+'''
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+import cannon
+
+CHANNELS = ("targets", "shells", "bombs", "cannons")
+# grayscale levels, types later in the list are drawn over earlier ones
+GRAY = {"bombs": 64, "shells": 128, "targets": 192, "cannons": 255}
+TANK_HALF = (cannon.Cannon.tank_base_width / 2, cannon.Cannon.tank_base_height / 2)
+
+
+def manager_entities(mgrs):
+    '''
+    Entities of a list of managers as {type: (game index, coordinates, half sizes, rounded)}.
+    Half sizes are per axis, rounded entities are circles and the others boxes.
+    :mgrs
+    '''
+    entities = {}
+    for name, store in (("targets", "targets"), ("shells", "shells"), ("bombs", "bombs")):
+        stores = [getattr(mgr, store) for mgr in mgrs]
+        counts = [len(s) for s in stores]
+        game = np.repeat(np.arange(len(mgrs)), counts)
+        coord = np.concatenate([s.coord[:len(s)] for s in stores]) if stores else np.zeros((0, 2))
+        radius = np.concatenate([s.radius[:len(s)] for s in stores]) if stores else np.zeros(0)
+        entities[name] = (game, coord, np.repeat(radius[:, None], 2, axis=1), True)
+    tanks = [[gun.coord for gun, _ in mgr.tanks()] for mgr in mgrs]
+    game = np.repeat(np.arange(len(mgrs)), [len(t) for t in tanks])
+    coord = np.array([coord for t in tanks for coord in t], dtype=np.float64).reshape(-1, 2)
+    entities["cannons"] = (game, coord, np.broadcast_to(TANK_HALF, coord.shape), False)
+    return entities
+
+
+def vecenv_entities(env):
+    '''
+    Entities of every game of a VecEnv, in the form of manager_entities.
+    :env
+    '''
+    entities = {}
+    game, slot = np.nonzero(env.target_alive)
+    radius = env.target_radius[game, slot]
+    entities["targets"] = (game, env.target_coord[game, slot], np.repeat(radius[:, None], 2, axis=1), True)
+    game, slot = np.nonzero(env.shell_alive)
+    radius = env.shell_radius[env.shell_type[game, slot]]
+    entities["shells"] = (game, env.shell_coord[game, slot], np.repeat(radius[:, None], 2, axis=1), True)
+    game, slot = np.nonzero(env.bomb_alive)
+    entities["bombs"] = (game, env.bomb_coord[game, slot], np.full((len(game), 2), float(env.bomb_radius)), True)
+    game = np.arange(env.num_envs)
+    entities["cannons"] = (game, env.gun_coord, np.broadcast_to(env.tank_half, env.gun_coord.shape), False)
+    return entities
+
+
+class ObservationRenderer:
+    '''
+    Draws many games at once into a reused (games, channels, height, width) uint8 buffer.
+    '''
+    def __init__(self, size=(84, 84), grayscale=False):
+        '''
+        Constructor method. Size is (width, height) like pygame sizes.
+        :self, size, grayscale
+        '''
+        self.size = size
+        self.grayscale = grayscale
+        self.channels = 1 if grayscale else len(CHANNELS)
+        self.scale = np.array(size, dtype=np.float64) / cannon.SCREEN_SIZE
+        self.buffer = np.zeros((0, self.channels, size[1], size[0]), dtype=np.uint8)
+
+    def render(self, games):
+        '''
+        Draws a Manager, a list of Managers or all games of a VecEnv. Returns the buffer,
+        valid until the next call.
+        :self, games
+        '''
+        if isinstance(games, cannon.Manager):
+            games = [games]
+        if isinstance(games, (list, tuple)):
+            count, entities = len(games), manager_entities(games)
+        else:
+            count, entities = games.num_envs, vecenv_entities(games)
+        if len(self.buffer) != count:
+            width, height = self.size
+            self.buffer = np.zeros((count, self.channels, height, width), dtype=np.uint8)
+        else:
+            self.buffer[:] = 0
+        order = sorted(CHANNELS, key=GRAY.get) if self.grayscale else CHANNELS
+        for name in order:
+            channel = 0 if self.grayscale else CHANNELS.index(name)
+            value = GRAY[name] if self.grayscale else 255
+            self.stamp(channel, value, *entities[name])
+        return self.buffer
+
+    def stamp(self, channel, value, game, coord, half, rounded):
+        '''
+        Sets the pixels whose centers are inside each entity, and at least the pixel under its
+        center, to value. All entities are stamped together through one window of pixels sized
+        for the largest one.
+        :self, channel, value, game, coord, half, rounded
+        '''
+        if len(game) == 0:
+            return
+        width, height = self.size
+        center = coord * self.scale
+        half = np.asarray(half) * self.scale
+        reach_x, reach_y = (int(math.ceil(h)) for h in half.max(axis=0))
+        dx = np.arange(-reach_x, reach_x + 1)
+        dy = np.arange(-reach_y, reach_y + 1)
+        # pixels of every entity's window, (entities, window rows, window columns)
+        x = np.floor(center[:, 0]).astype(np.int64)[:, None, None] + dx[None, None, :]
+        y = np.floor(center[:, 1]).astype(np.int64)[:, None, None] + dy[None, :, None]
+        u = (x + 0.5 - center[:, 0, None, None]) / half[:, 0, None, None]
+        v = (y + 0.5 - center[:, 1, None, None]) / half[:, 1, None, None]
+        if rounded:
+            inside = u*u + v*v <= 1
+        else:
+            inside = (np.abs(u) <= 1) & (np.abs(v) <= 1)
+        inside |= (dx[None, None, :] == 0) & (dy[None, :, None] == 0)
+        inside &= (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        entity, row, column = np.nonzero(inside)
+        self.buffer[game[entity], channel, y[entity, row, 0], x[entity, 0, column]] = value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--envs", type=int, default=4096, help="games of the VecEnv rendered together")
+    parser.add_argument("--ticks", type=int, default=50, help="steps to render")
+    parser.add_argument("--size", type=int, default=84, help="width and height of the observations")
+    parser.add_argument("--grayscale", action="store_true", help="one gray channel instead of one per type")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    import vecenv
+    env = vecenv.VecEnv(args.envs, seed=args.seed)
+    env.reset()
+    rng = np.random.default_rng(args.seed)
+    renderer = ObservationRenderer((args.size, args.size), args.grayscale)
+    elapsed = 0.0
+    for _ in range(args.ticks):
+        env.step(vecenv.random_actions(env, rng))
+        start = time.perf_counter()
+        pixels = renderer.render(env)
+        elapsed += time.perf_counter() - start
+    print("{} observations of shape {} in {:.2f} s: {:.0f} frames/s, {:.1f} us per frame".format(
+        args.envs * args.ticks, pixels.shape[1:], elapsed, args.envs * args.ticks / elapsed,
+        elapsed / (args.envs * args.ticks) * 1e6))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+'''
+Deterministic record and replay of cannon games.
+
+A Manager draws all its randomness from its own seeded generator, so a game is
+fully described by its seed, its parameters and the action of every tick. The
+Recorder logs actions in a compact binary form (6 bytes per tick) and keeps a
+clone of the game every `interval` ticks as a keyframe. The file stores the
+keyframes after the log as snapshot.py snapshots with their tick. A Replay seeks
+to any tick by starting from the nearest keyframe before it, so a seek costs at
+most `interval` ticks of simulation instead of the whole game. Keyframes a replay
+doesn't have yet are made on the way.
+
+    python cannon.py --record game.rpl
+    python replay.py game.rpl --seek 5400 --ticks 300
+
+The second command jumps to tick 5400 and times the next 300 ticks one by one,
+listing the slowest ones, to look into a spike seen in a real game.
+
+The Monte-Carlo aimer stops on a time budget, so games where the NPC uses it
+can't be replayed exactly.
+'''
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import struct
+import sys
+import time
+
+import cannon
+import snapshot
+
+MAGIC = b"CNRP"
+VERSION = 2
+# magic, version, keyframe interval, seed, length of the JSON parameters that follow, logged ticks, keyframes
+HEADER = struct.Struct("<4sHIQIQI")
+# tick and snapshot length of a keyframe, followed by the snapshot
+KEYFRAME = struct.Struct("<QQ")
+# flags, direction, aim x, aim y
+ACTION = struct.Struct("<Bbhh")
+CHARGE, FIRE, SWITCH, QUIT, AIM = 1, 2, 4, 8, 16
+
+
+def pack_action(action):
+    '''
+    Packs an action into 6 bytes. Aim is rounded to whole pixels.
+    :action
+    '''
+    flags = (CHARGE * bool(action.charge) | FIRE * bool(action.fire) | SWITCH * bool(action.switch)
+             | QUIT * bool(action.quit))
+    x = y = 0
+    if action.aim is not None:
+        flags |= AIM
+        x, y = round(action.aim[0]), round(action.aim[1])
+    return ACTION.pack(flags, action.direction, x, y)
+
+
+def unpack_action(data, offset=0):
+    '''
+    Reads an action packed by pack_action.
+    :data, offset
+    '''
+    flags, direction, x, y = ACTION.unpack_from(data, offset)
+    return cannon.Action(aim=(x, y) if flags & AIM else None, charge=bool(flags & CHARGE),
+                         fire=bool(flags & FIRE), switch=bool(flags & SWITCH),
+                         direction=direction, quit=bool(flags & QUIT))
+
+
+class ActionLog:
+    '''
+    Actions of consecutive ticks, packed one after another in a bytearray.
+    '''
+    def __init__(self, data=b""):
+        self.data = bytearray(data)
+
+    def __len__(self):
+        return len(self.data) // ACTION.size
+
+    def __getitem__(self, tick):
+        if not 0 <= tick < len(self):
+            raise IndexError("tick {} not in the log of {} ticks".format(tick, len(self)))
+        return unpack_action(self.data, tick * ACTION.size)
+
+    def append(self, action):
+        '''
+        Logs the action of the next tick. Returns the action as it will be replayed.
+        :self, action
+        '''
+        packed = pack_action(action)
+        self.data += packed
+        return unpack_action(packed)
+
+
+class Recorder:
+    '''
+    Logs the actions of a game and keeps keyframes. Set as Manager.recorder, the manager
+    hands it every action before applying it and plays the logged version, so the recorded
+    game and its replay stay identical even when aims are fractional.
+    '''
+    def __init__(self, seed, params, interval=300):
+        '''
+        Constructor method. Seed and params are the ones the Manager was made with.
+        :self, seed, params, interval
+        '''
+        self.seed = seed
+        self.params = dict(params)
+        self.interval = interval
+        self.log = ActionLog()
+        self.keyframes = {}
+
+    def record(self, mgr, action):
+        '''
+        Logs the action of the manager's current tick. Returns the action to apply.
+        :self, mgr, action
+        '''
+        if mgr.tick % self.interval == 0:
+            self.keyframes[mgr.tick] = mgr.clone()
+        return self.log.append(action)
+
+    def replay(self):
+        '''
+        Replay of the game recorded so far, sharing the recorder's keyframes.
+        :self
+        '''
+        return Replay(self.seed, self.params, ActionLog(self.log.data), self.interval, self.keyframes)
+
+    def save(self, path):
+        '''
+        Writes seed, parameters, the action log and the keyframes to a file.
+        :self, path
+        '''
+        params = json.dumps(self.params).encode()
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.interval, self.seed, len(params), len(self.log),
+                                len(self.keyframes)))
+            f.write(params)
+            f.write(self.log.data)
+            for tick in sorted(self.keyframes):
+                state = snapshot.dumps(self.keyframes[tick])
+                f.write(KEYFRAME.pack(tick, len(state)))
+                f.write(state)
+
+
+class Replay:
+    '''
+    Replays a recorded game. Seeking starts from the nearest keyframe at or before the tick.
+    '''
+    def __init__(self, seed, params, log, interval=300, keyframes=None):
+        '''
+        Constructor method.
+        :self, seed, params, log, interval, keyframes
+        '''
+        self.seed = seed
+        self.params = dict(params)
+        self.log = log
+        self.interval = interval
+        self.keyframes = dict(keyframes or {})
+        if 0 not in self.keyframes:
+            self.keyframes[0] = cannon.Manager(seed=seed, **self.params)
+
+    def __len__(self):
+        return len(self.log)
+
+    def seek(self, tick):
+        '''
+        Returns a new manager in the state at the start of the tick, before its action.
+        :self, tick
+        '''
+        if not 0 <= tick <= len(self.log):
+            raise IndexError("tick {} not in the replay of {} ticks".format(tick, len(self.log)))
+        start = max(t for t in self.keyframes if t <= tick)
+        mgr = self.keyframes[start].clone()
+        while mgr.tick < tick:
+            mgr.step(self.log[mgr.tick])
+            if mgr.tick % self.interval == 0 and mgr.tick not in self.keyframes:
+                self.keyframes[mgr.tick] = mgr.clone()
+        return mgr
+
+    def play(self, mgr, ticks):
+        '''
+        Steps the manager through the logged actions of the next ticks, up to the end of the log.
+        :self, mgr, ticks
+        '''
+        for tick in range(mgr.tick, min(len(self.log), mgr.tick + ticks)):
+            mgr.step(self.log[tick])
+        return mgr
+
+
+def load(path):
+    '''
+    Reads a file written by Recorder.save. Returns a Replay with the saved keyframes.
+    :path
+    '''
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, interval, seed, params_len, ticks, count = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("{} is not a version {} replay file".format(path, VERSION))
+    start = HEADER.size + params_len
+    params = json.loads(data[HEADER.size:start].decode())
+    offset = start + ticks * ACTION.size
+    log = ActionLog(data[start:offset])
+    keyframes = {}
+    for _ in range(count):
+        tick, size = KEYFRAME.unpack_from(data, offset)
+        offset += KEYFRAME.size
+        # a bytearray of its own, so the stores of the keyframe are views into it
+        keyframes[tick] = snapshot.loads(bytearray(data[offset:offset + size]))
+        offset += size
+    return Replay(seed, params, log, interval, keyframes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="replay file written by cannon.py --record")
+    parser.add_argument("--seek", type=int, default=0, help="tick to jump to")
+    parser.add_argument("--ticks", type=int, default=300, help="ticks to time after the seek")
+    parser.add_argument("--top", type=int, default=10, help="slowest ticks to list")
+    args = parser.parse_args(argv)
+
+    replay = load(args.path)
+    if not 0 <= args.seek <= len(replay):
+        parser.error("--seek must be between 0 and {}, the recorded ticks".format(len(replay)))
+    start = time.perf_counter()
+    mgr = replay.seek(args.seek)
+    print("{} ticks recorded, seek to {} took {:.1f} ms".format(
+        len(replay), args.seek, (time.perf_counter() - start) * 1e3))
+
+    timings = []
+    clock = time.perf_counter_ns
+    for tick in range(args.seek, min(len(replay), args.seek + args.ticks)):
+        start = clock()
+        mgr.step(replay.log[tick])
+        timings.append((clock() - start, tick))
+    if not timings:
+        return 0
+    ordered = sorted(timings)
+    print("{} ticks: median {:.3f} ms, p99 {:.3f} ms, max {:.3f} ms".format(
+        len(ordered), ordered[len(ordered) // 2][0] / 1e6,
+        ordered[min(len(ordered) - 1, len(ordered) * 99 // 100)][0] / 1e6, ordered[-1][0] / 1e6))
+    for ns, tick in ordered[::-1][:args.top]:
+        print("tick {:>8} {:>9.3f} ms".format(tick, ns / 1e6))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
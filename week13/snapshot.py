@@ -0,0 +1,214 @@
+'''
+Binary snapshots of whole game states, for save games, crash dumps and fixtures.
+
+A snapshot is a fixed header, one record of a NumPy structured dtype with every
+scalar of the Manager (settings, score table, both cannons, random generator
+state, row counts) and then, for the shell, target and bomb stores, one raw block
+per field. Blocks start at multiples of 8 bytes. Loading reads the file into one
+bytearray and makes every store field a np.frombuffer view of its block, so no
+entity is parsed in Python and a state of 100k entities loads in milliseconds.
+The stores copy out of the buffer the first time they grow.
+
+    snapshot.save(mgr, "game.snap")
+    mgr = snapshot.load("game.snap")
+'''
+import struct
+import zlib
+
+import numpy as np
+
+import cannon
+
+MAGIC = b"CNSS"
+VERSION = 1
+# magic, version, layout checksum
+HEADER = struct.Struct("<4sHI")
+ALIGN = 8
+
+CANNON = np.dtype([
+    ('coord', '<f8', (2,)),
+    ('angle', '<f8'),
+    ('max_pow', '<f8'),
+    ('min_pow', '<f8'),
+    ('color', 'u1', (3,)),
+    ('active', '?'),
+    ('pow', '<f8'),
+    ('radius', '<f8'),
+    ('velocity', '<f8', (2,)), # AICannon only
+])
+
+STATE = np.dtype([
+    ('tick', '<i8'),
+    ('target_tick', '<i8'),
+    ('seed', '<i8'), # -1 if the game wasn't seeded
+    ('num_of_targets', '<i8'),
+    ('gravity', '<f8'),
+    ('bomb_chance', '<f8'),
+    ('max_radius', '<f8'),
+    ('shrink', '<f8'),
+    ('shell_type_index', '<i8'),
+    ('target_destroyed', '<i8'),
+    ('shell_used', '<i8'),
+    ('hit', '<i8'),
+    ('gun', CANNON),
+    ('npc', CANNON),
+    ('rng_version', '<i8'),
+    ('rng_key', '<u4', (625,)),
+    ('rng_gauss', '<f8'), # NaN if there is no cached gaussian
+    ('shells', '<i8'),
+    ('targets', '<i8'),
+    ('bombs', '<i8'),
+    ('shells_next_uid', '<i8'),
+    ('targets_next_uid', '<i8'),
+    ('bombs_next_uid', '<i8'),
+])
+
+STORES = [('shells', cannon.ShellStore), ('targets', cannon.TargetStore), ('bombs', cannon.BombStore)]
+
+
+def layout_checksum():
+    '''
+    Checksum of the record dtype and every store's fields, so snapshots from an
+    incompatible version of the game are refused instead of misread.
+    '''
+    layout = [STATE.descr] + [(name, [(field, np.dtype(dtype).str, shape) for field, (dtype, shape) in store.fields.items()])
+                              for name, store in STORES]
+    return zlib.crc32(repr(layout).encode())
+
+
+def padding(size):
+    return -size % ALIGN
+
+
+def pack_cannon(record, gun):
+    record['coord'] = gun.coord
+    record['angle'] = gun.angle
+    record['max_pow'] = gun.max_pow
+    record['min_pow'] = gun.min_pow
+    record['color'] = gun.color
+    record['active'] = gun.active
+    record['pow'] = gun.pow
+    record['radius'] = gun.radius
+    if isinstance(gun, cannon.AICannon):
+        record['velocity'] = (gun.x_velocity, gun.y_velocity)
+
+
+def unpack_cannon(record, gun):
+    gun.coord = record['coord'].tolist()
+    gun.angle = float(record['angle'])
+    gun.max_pow = float(record['max_pow'])
+    gun.min_pow = float(record['min_pow'])
+    gun.color = tuple(record['color'].tolist())
+    gun.active = bool(record['active'])
+    gun.pow = float(record['pow'])
+    gun.radius = float(record['radius'])
+    if isinstance(gun, cannon.AICannon):
+        gun.x_velocity, gun.y_velocity = record['velocity'].tolist()
+
+
+def dumps(mgr):
+    '''
+    Snapshot of the manager's game state as bytes.
+    :mgr
+    '''
+    state = np.zeros(1, dtype=STATE)
+    record = state[0]
+    record['tick'] = mgr.tick
+    record['target_tick'] = mgr.targets.tick
+    record['seed'] = -1 if mgr.seed is None else mgr.seed
+    record['num_of_targets'] = mgr.num_of_targets
+    record['gravity'] = mgr.gravity
+    record['bomb_chance'] = mgr.bomb_chance
+    record['max_radius'] = mgr.max_radius
+    record['shrink'] = mgr.shrink
+    record['shell_type_index'] = mgr.shell_type_index
+    record['target_destroyed'] = mgr.score_table.target_destroyed
+    record['shell_used'] = mgr.score_table.shell_used
+    record['hit'] = mgr.score_table.hit
+    pack_cannon(record['gun'], mgr.gun)
+    pack_cannon(record['npc'], mgr.npc)
+    version, key, gauss = mgr.rng.getstate()
+    record['rng_version'] = version
+    record['rng_key'] = key
+    record['rng_gauss'] = np.nan if gauss is None else gauss
+    for name, _ in STORES:
+        record[name] = len(getattr(mgr, name))
+        record[name + '_next_uid'] = getattr(mgr, name).next_uid
+
+    out = bytearray(HEADER.pack(MAGIC, VERSION, layout_checksum()))
+    out += bytes(padding(len(out)))
+    out += state.tobytes()
+    for name, _ in STORES:
+        store = getattr(mgr, name)
+        for field in store.fields:
+            out += bytes(padding(len(out)))
+            out += np.ascontiguousarray(getattr(store, field)[:len(store)]).tobytes()
+    return bytes(out)
+
+
+def loads(data):
+    '''
+    Manager with the state of a snapshot. With a bytearray, the stores are views into it.
+    :data
+    '''
+    buffer = data if isinstance(data, bytearray) else bytearray(data)
+    magic, version, checksum = HEADER.unpack_from(buffer)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a version {} cannon snapshot".format(VERSION))
+    if checksum != layout_checksum():
+        raise ValueError("snapshot was written by a version of the game with a different state layout")
+    offset = HEADER.size + padding(HEADER.size)
+    record = np.frombuffer(buffer, dtype=STATE, count=1, offset=offset)[0]
+    offset += STATE.itemsize
+
+    mgr = cannon.Manager(num_of_targets=int(record['num_of_targets']), gravity=float(record['gravity']),
+                         bomb_chance=float(record['bomb_chance']), max_radius=float(record['max_radius']),
+                         shrink=float(record['shrink']), seed=None if record['seed'] < 0 else int(record['seed']))
+    mgr.tick = int(record['tick'])
+    mgr.shell_type_index = int(record['shell_type_index'])
+    mgr.shell_type = mgr.shell_types[mgr.shell_type_index]
+    mgr.score_table.target_destroyed = int(record['target_destroyed'])
+    mgr.score_table.shell_used = int(record['shell_used'])
+    mgr.score_table.hit = int(record['hit'])
+    unpack_cannon(record['gun'], mgr.gun)
+    unpack_cannon(record['npc'], mgr.npc)
+    gauss = float(record['rng_gauss'])
+    mgr.rng.setstate((int(record['rng_version']), tuple(record['rng_key'].tolist()),
+                      None if np.isnan(gauss) else gauss))
+
+    for name, store_type in STORES:
+        rows = int(record[name])
+        store = store_type(0)
+        for field, (dtype, shape) in store_type.fields.items():
+            offset += padding(offset)
+            count = rows * int(np.prod(shape, dtype=np.int64))
+            array = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).reshape((rows,) + shape)
+            setattr(store, field, array)
+            offset += array.nbytes
+        store.size = store.capacity = rows
+        store.next_uid = int(record[name + '_next_uid'])
+        setattr(mgr, name, store)
+    mgr.targets.tick = int(record['target_tick'])
+    return mgr
+
+
+def save(mgr, path):
+    '''
+    Writes a snapshot of the manager to a file.
+    :mgr, path
+    '''
+    with open(path, "wb") as f:
+        f.write(dumps(mgr))
+
+
+def load(path):
+    '''
+    Reads a snapshot file into a new manager, with one read into one buffer.
+    :path
+    '''
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        buffer = bytearray(f.tell())
+        f.seek(0)
+        f.readinto(buffer)
+    return loads(buffer)
@@ -0,0 +1,420 @@
+'''
+Vectorized environment stepping many cannon games at once, for training aiming agents.
+
+VecEnv holds N independent games in NumPy arrays with one row per game and a
+fixed number of slots per row for shells, targets and bombs, and advances all
+of them with one batched step(actions): shell flight and wall bounces, target
+motion, bomb drops and swept shell-target, shell-cannon and bomb-cannon
+collisions run as a handful of array operations over every game together.
+The rules are Manager.step's for the player's cannon, with the shell types,
+target kinds and score of cannon.py. The NPC cannon is left out and each shot
+gives its power directly instead of charging over several ticks.
+
+The API follows Gym's vector environments:
+
+    env = VecEnv(4096, seed=0)
+    obs, info = env.reset()
+    obs, reward, terminated, truncated, info = env.step(actions)
+
+Actions have one row per game: angle (radians), power, fire (> 0.5 shoots),
+shell type index and move (-1, 0, 1 moves the cannon like the arrow keys).
+Rewards are the change of ScoreTable.score(). Cleared games get new targets
+through new_mission as in Manager.check_mission; games reaching
+episode_ticks are truncated and reset in the same step, their final scores
+are in info["final_score"].
+
+    python vecenv.py --envs 4096 --ticks 200
+'''
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import cannon
+
+ANGLE, POWER, FIRE, SHELL, MOVE = range(5)
+SHELL_TYPES = [cannon.Shell, cannon.PowerfulShell, cannon.BigShell]
+
+
+class VecEnv:
+    '''
+    N cannon games stepped together. Slots of a row that are not in use have their alive flag cleared.
+    '''
+    def __init__(self, num_envs, num_of_targets=1, gravity=2, bomb_chance=0.005, max_radius=30, shrink=1,
+                 max_shells=4, max_bombs=8, episode_ticks=900, seed=None):
+        '''
+        Constructor method. Game parameters are the Manager's. Shots when all max_shells slots are
+        in use and bombs when all max_bombs slots are in use are skipped.
+        :self, num_envs, num_of_targets, gravity, bomb_chance, max_radius, shrink, max_shells, max_bombs, episode_ticks, seed
+        '''
+        self.num_envs = n = num_envs
+        self.num_of_targets = num_of_targets
+        self.gravity = gravity
+        self.bomb_chance = bomb_chance
+        self.max_radius = max_radius
+        self.shrink = shrink
+        self.episode_ticks = episode_ticks
+        self.rng = np.random.default_rng(seed)
+        self.screen = np.array(cannon.SCREEN_SIZE, dtype=np.float64)
+
+        shells = [shell_type([0, 0], [0, 0], color=cannon.BLACK) for shell_type in SHELL_TYPES]
+        self.shell_radius = np.array([shell.radius for shell in shells], dtype=np.float64)
+        self.shell_gravity = np.array([shell.gravity_multiplier for shell in shells], dtype=np.float64)
+        self.shell_alive_max = np.array([getattr(shell, 'alive_max', -1) for shell in shells], dtype=np.int64)
+
+        gun = cannon.Cannon()
+        self.min_pow, self.max_pow = gun.min_pow, gun.max_pow
+        self.gun_radius = gun.radius
+        self.gun_coord = np.tile(np.array(gun.coord, dtype=np.float64), (n, 1))
+        self.tank_half = np.array([gun.tank_base_width / 2, gun.tank_base_height / 2])
+
+        # every mission spawns one target of each kind per num_of_targets, in the order of Manager.new_mission
+        t = 3 * num_of_targets
+        self.target_kind = np.tile([cannon.TargetStore.STATIC, cannon.TargetStore.MOVING, cannon.TargetStore.CIRCULAR],
+                                   num_of_targets)
+        self.target_coord = np.zeros((n, t, 2))
+        self.target_prev = np.zeros((n, t, 2))
+        self.target_radius = np.zeros((n, t))
+        self.target_velocity = np.zeros((n, t, 2)) # moving targets
+        self.target_center = np.zeros((n, t, 2)) # circular targets
+        self.target_circle = np.zeros((n, t))
+        self.target_angle = np.zeros((n, t))
+        self.target_step = np.zeros((n, t))
+        self.target_alive = np.zeros((n, t), dtype=np.bool_)
+
+        self.shell_coord = np.zeros((n, max_shells, 2))
+        self.shell_prev = np.zeros((n, max_shells, 2))
+        self.shell_velocity = np.zeros((n, max_shells, 2))
+        self.shell_type = np.zeros((n, max_shells), dtype=np.int64)
+        self.shell_timer = np.zeros((n, max_shells), dtype=np.int64)
+        self.shell_fired = np.zeros((n, max_shells), dtype=np.bool_)
+        self.shell_alive = np.zeros((n, max_shells), dtype=np.bool_)
+
+        self.bomb_coord = np.zeros((n, max_bombs, 2))
+        self.bomb_prev = np.zeros((n, max_bombs, 2))
+        self.bomb_velocity = np.zeros((n, max_bombs, 2))
+        self.bomb_alive = np.zeros((n, max_bombs), dtype=np.bool_)
+        self.bomb_radius = cannon.Bomb([0, 0], [0, 0]).radius
+        self.bomb_gravity = cannon.Bomb([0, 0], [0, 0]).gravity
+
+        self.score_table = cannon.ScoreTable(np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64))
+        self.score_table.hit = np.zeros(n, dtype=np.int64)
+        self.ticks = np.zeros(n, dtype=np.int64)
+        self.observation_size = 2 + 6 * t + 3 * max_shells + 3 * max_bombs
+        self.observation = np.zeros((n, self.observation_size), dtype=np.float32)
+
+    def reset(self, seed=None):
+        '''
+        Starts every game over. Returns observations and an empty info dict.
+        :self, seed
+        '''
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self.reset_envs(np.ones(self.num_envs, dtype=np.bool_))
+        return self.observe(), {}
+
+    def reset_envs(self, done):
+        '''
+        Starts the games of the mask over, with no shells, no bombs, a zero score and new targets.
+        :self, done
+        '''
+        self.shell_alive[done] = False
+        self.bomb_alive[done] = False
+        self.gun_coord[done] = cannon.Cannon().coord
+        self.score_table.target_destroyed[done] = 0
+        self.score_table.shell_used[done] = 0
+        self.score_table.hit[done] = 0
+        self.ticks[done] = 0
+        self.new_mission(done)
+
+    def target_radius_range(self):
+        '''
+        Smallest and largest radius of new targets for each game's score, as Manager.target_radius_range.
+        :self
+        '''
+        score = np.maximum(0, self.score_table.score())
+        low = np.maximum(1, self.max_radius - 2 * self.shrink * score)
+        high = np.maximum(low, self.max_radius - self.shrink * score)
+        return low.astype(np.int64), high.astype(np.int64)
+
+    def new_mission(self, envs):
+        '''
+        Spawns a new set of targets in the games of the mask, drawn like Target, MovingTargets and CircularTargets.
+        :self, envs
+        '''
+        rows = np.flatnonzero(envs)
+        if len(rows) == 0:
+            return
+        rng, t = self.rng, self.target_kind.size
+        low, high = self.target_radius_range()
+        radius = rng.integers(low[rows, None], high[rows, None] + 1, size=(len(rows), t)).astype(np.float64)
+        coord = rng.integers(radius[..., None], self.screen - radius[..., None] + 1).astype(np.float64)
+        self.target_radius[rows] = radius
+        self.target_coord[rows] = coord
+        self.target_prev[rows] = coord
+        self.target_alive[rows] = True
+        self.target_velocity[rows] = np.where(self.target_kind[:, None] == cannon.TargetStore.MOVING,
+                                              rng.integers(-2, 3, size=(len(rows), t, 2)), 0)
+        circular = self.target_kind == cannon.TargetStore.CIRCULAR
+        self.target_center[rows] = coord
+        self.target_circle[rows] = rng.integers(20, 51, size=(len(rows), t))
+        self.target_angle[rows] = 1
+        clockwise = rng.integers(0, 2, size=(len(rows), t)) * 2 - 1
+        self.target_step[rows] = np.where(circular, rng.integers(1, 5, size=(len(rows), t)) * 0.03 * clockwise, 0)
+
+    def step(self, actions):
+        '''
+        Advances every game one tick, in the order of Manager.step: actions, moves, collisions,
+        bombs, missions. Returns observations, rewards, terminated, truncated and info.
+        :self, actions
+        '''
+        actions = np.asarray(actions, dtype=np.float64)
+        score = self.score_table.score()
+        self.apply_actions(actions)
+        self.move()
+        self.collide()
+        self.bomb_process()
+        self.check_mission()
+
+        reward = self.score_table.score() - score
+        truncated = self.ticks >= self.episode_ticks
+        terminated = np.zeros(self.num_envs, dtype=np.bool_)
+        info = {}
+        if truncated.any():
+            info["final_score"] = np.where(truncated, self.score_table.score(), 0)
+            self.reset_envs(truncated)
+        return self.observe(), reward.astype(np.float32), terminated, truncated, info
+
+    def apply_actions(self, actions):
+        '''
+        Moves the cannons and fires the shots of the actions, as Cannon.move and Cannon.strike.
+        :self, actions
+        '''
+        direction = np.clip(np.rint(actions[:, MOVE]), -1, 1)
+        x = self.gun_coord[:, 0]
+        can_move = ((x > 30) | (direction > 0)) & ((x < self.screen[0] - 30) | (direction < 0))
+        x += np.where(can_move, 10 * direction, 0)
+
+        free = ~self.shell_alive
+        fire = (actions[:, FIRE] > 0.5) & free.any(axis=1)
+        rows = np.flatnonzero(fire)
+        if len(rows) == 0:
+            return
+        slot = free[rows].argmax(axis=1)
+        angle = actions[rows, ANGLE]
+        power = np.clip(actions[rows, POWER], self.min_pow, self.max_pow)
+        shell_type = np.clip(actions[rows, SHELL].astype(np.int64), 0, len(SHELL_TYPES) - 1)
+        self.shell_coord[rows, slot] = self.gun_coord[rows]
+        self.shell_prev[rows, slot] = self.gun_coord[rows]
+        self.shell_velocity[rows, slot, 0] = np.trunc(power * np.cos(angle))
+        self.shell_velocity[rows, slot, 1] = np.trunc(power * np.sin(angle))
+        self.shell_type[rows, slot] = shell_type
+        self.shell_timer[rows, slot] = 0
+        self.shell_fired[rows, slot] = False
+        self.shell_alive[rows, slot] = True
+        self.score_table.shell_used[rows] += 1
+
+    def move(self):
+        '''
+        Moves shells as ShellStore.move, targets as their move methods and bombs as BombStore.move.
+        :self
+        '''
+        # shells, dead slots are moved too and stay dead
+        coord, velocity, alive = self.shell_coord, self.shell_velocity, self.shell_alive
+        radius = self.shell_radius[self.shell_type]
+        self.shell_prev[:] = coord
+        velocity[..., 1] += self.gravity * self.shell_gravity[self.shell_type]
+        coord += velocity
+        self.shell_timer += 1
+        for i in range(2):
+            low = coord[..., i] < radius
+            high = coord[..., i] > self.screen[i] - radius
+            coord[..., i] = np.clip(coord[..., i], radius, self.screen[i] - radius)
+            hit = low | high
+            velocity[..., i] = np.where(hit, -np.trunc(velocity[..., i] * 0.8), velocity[..., i])
+            velocity[..., 1-i] = np.where(hit, np.trunc(velocity[..., 1-i] * 0.9), velocity[..., 1-i])
+        alive_max = self.shell_alive_max[self.shell_type]
+        timed = alive_max >= 0
+        on_floor = coord[..., 1] > self.screen[1] - 2*radius
+        vx, vy = velocity[..., 0], velocity[..., 1]
+        stopped = ~timed & on_floor & (vx**2 + vy**2 < 2**2)
+        expired = timed & (self.shell_timer > alive_max)
+        self.shell_fired |= ~timed & on_floor & (vx**3 + vy**3 < 3**3)
+        alive &= ~(stopped | expired)
+
+        # targets: moving ones turn once past a border, circular ones go around their center
+        coord, velocity, radius = self.target_coord, self.target_velocity, self.target_radius
+        self.target_prev[:] = coord
+        coord += velocity
+        past = (coord + radius[..., None] > self.screen) | (coord - radius[..., None] < 0)
+        velocity[past] *= -1
+        circular = self.target_kind == cannon.TargetStore.CIRCULAR
+        angle = np.pi * self.target_angle[:, circular]
+        center, circle = self.target_center[:, circular], self.target_circle[:, circular]
+        coord[:, circular, 0] = center[..., 0] + np.cos(angle) * circle
+        coord[:, circular, 1] = center[..., 1] + np.sin(angle) * circle
+        self.target_angle += self.target_step
+
+        self.bomb_prev[:] = self.bomb_coord
+        self.bomb_coord[..., 1] += self.bomb_gravity
+        self.bomb_coord += self.bomb_velocity
+
+    def collide(self):
+        '''
+        Swept collisions of every game at once, as Manager.collide: shells destroy targets,
+        fired shells hit the cannon and bombs hit the tank. Pairs are first checked with the
+        circles around their sweeps over all games, the exact test only runs on the few that are close.
+        :self
+        '''
+        table = self.score_table
+        shell_radius = self.shell_radius[self.shell_type]
+        shell_motion = self.shell_coord - self.shell_prev
+        shell_mid = (self.shell_prev + self.shell_coord) / 2
+        shell_reach = shell_radius + np.hypot(shell_motion[..., 0], shell_motion[..., 1]) / 2
+
+        # shell target, candidates over (games, shells, targets)
+        target_motion = self.target_coord - self.target_prev
+        target_mid = (self.target_prev + self.target_coord) / 2
+        target_reach = self.target_radius + np.hypot(target_motion[..., 0], target_motion[..., 1]) / 2
+        dx = shell_mid[:, :, None, 0] - target_mid[:, None, :, 0]
+        dy = shell_mid[:, :, None, 1] - target_mid[:, None, :, 1]
+        reach = shell_reach[:, :, None] + target_reach[:, None]
+        close = (dx*dx + dy*dy <= reach*reach) & self.shell_alive[:, :, None] & self.target_alive[:, None]
+        env, shell, target = np.nonzero(close)
+        if len(env):
+            toi = cannon.time_of_impact(self.shell_prev[env, shell] - self.target_prev[env, target],
+                                        shell_motion[env, shell] - target_motion[env, target],
+                                        shell_radius[env, shell] + self.target_radius[env, target])
+            hit = ~np.isnan(toi)
+            destroyed = np.zeros_like(self.target_alive)
+            destroyed[env[hit], target[hit]] = True
+            table.target_destroyed += destroyed.sum(axis=1)
+            self.target_alive &= ~destroyed
+
+        # fired shell cannon, the cannon stands still within the tick
+        offset = shell_mid - self.gun_coord[:, None]
+        reach = shell_reach + self.gun_radius
+        close = ((offset**2).sum(axis=2) <= reach*reach) & self.shell_alive & self.shell_fired
+        env, shell = np.nonzero(close)
+        if len(env):
+            toi = cannon.time_of_impact(self.shell_prev[env, shell] - self.gun_coord[env], shell_motion[env, shell],
+                                        shell_radius[env, shell] + self.gun_radius)
+            hit = ~np.isnan(toi)
+            np.add.at(table.hit, env[hit], 1)
+            self.shell_alive[env[hit], shell[hit]] = False
+
+        # bomb tank
+        bomb_motion = self.bomb_coord - self.bomb_prev
+        offset = np.abs((self.bomb_prev + self.bomb_coord) / 2 - self.gun_coord[:, None])
+        close = np.all(offset < self.bomb_radius + self.tank_half + np.abs(bomb_motion) / 2, axis=2) & self.bomb_alive
+        env, bomb = np.nonzero(close)
+        if len(env):
+            toi = cannon.box_time_of_impact(self.bomb_prev[env, bomb] - self.gun_coord[env], bomb_motion[env, bomb],
+                                            self.bomb_radius + self.tank_half)
+            hit = ~np.isnan(toi)
+            np.add.at(table.hit, env[hit], 1)
+            self.bomb_alive[env[hit], bomb[hit]] = False
+
+    def bomb_process(self):
+        '''
+        Drops bombs from targets with the bomb chance and removes bombs off the screen, as Manager.bomb_process.
+        The k-th bomb of a game in a tick goes into its k-th free slot.
+        :self
+        '''
+        drop = self.target_alive & (self.rng.random(self.target_alive.shape) < self.bomb_chance)
+        free_env, slot = np.nonzero(~self.bomb_alive)
+        if drop.any() and len(free_env):
+            env, target = np.nonzero(drop)
+            # rank of every drop and every free slot within its game
+            drop_rank = np.arange(len(env)) - np.searchsorted(env, env)
+            free_rank = np.arange(len(free_env)) - np.searchsorted(free_env, free_env)
+            width = max(self.target_kind.size, self.bomb_alive.shape[1])
+            match = np.searchsorted(free_env * width + free_rank, env * width + drop_rank)
+            match = np.minimum(match, len(free_env) - 1)
+            placed = (free_env[match] == env) & (free_rank[match] == drop_rank)
+            env, target, slot = env[placed], target[placed], slot[match[placed]]
+            self.bomb_coord[env, slot] = self.target_coord[env, target]
+            self.bomb_prev[env, slot] = self.target_coord[env, target]
+            self.bomb_velocity[env, slot, 0] = self.rng.integers(-2, 3, size=len(env))
+            self.bomb_velocity[env, slot, 1] = self.rng.integers(-1, 3, size=len(env))
+            self.bomb_alive[env, slot] = True
+
+        x, y = self.bomb_coord[..., 0], self.bomb_coord[..., 1]
+        self.bomb_alive &= (y <= self.screen[1]) & (x - self.bomb_radius >= 0) & (x + self.bomb_radius <= self.screen[0])
+
+    def check_mission(self):
+        '''
+        New targets for games without targets and shells, as Manager.check_mission, and the tick count.
+        :self
+        '''
+        cleared = ~self.target_alive.any(axis=1) & ~self.shell_alive.any(axis=1)
+        self.new_mission(cleared)
+        self.ticks += 1
+
+    def observe(self):
+        '''
+        Observation of every game as one row of floats, coordinates in screen sizes:
+        cannon (x, y), targets (x, y, dx, dy, radius, alive), shells (x, y, alive), bombs (x, y, alive).
+        Dead slots are all zeros.
+        :self
+        '''
+        n, screen, obs = self.num_envs, self.screen, self.observation
+        t, shells, bombs = self.target_alive.shape[1], self.shell_alive.shape[1], self.bomb_alive.shape[1]
+        obs[:, :2] = self.gun_coord / screen
+        targets = obs[:, 2:2 + 6*t].reshape(n, t, 6)
+        targets[..., 0:2] = self.target_coord / screen
+        targets[..., 2:4] = (self.target_coord - self.target_prev) / screen
+        targets[..., 4] = self.target_radius / screen[0]
+        targets[..., 5] = self.target_alive
+        targets *= targets[..., 5:6]
+        start = 2 + 6*t
+        for coord, alive, count in ((self.shell_coord, self.shell_alive, shells), (self.bomb_coord, self.bomb_alive, bombs)):
+            block = obs[:, start:start + 3*count].reshape(n, count, 3)
+            block[..., 0:2] = coord / screen
+            block[..., 2] = alive
+            block *= block[..., 2:3]
+            start += 3*count
+        return self.observation.copy()
+
+
+def random_actions(env, rng):
+    '''
+    Random shots at random angles above the horizon, for benchmarks.
+    :env, rng
+    '''
+    n = env.num_envs
+    actions = np.zeros((n, 5))
+    actions[:, ANGLE] = rng.uniform(-np.pi, 0, n)
+    actions[:, POWER] = rng.uniform(env.min_pow, env.max_pow, n)
+    actions[:, FIRE] = rng.random(n) < 0.1
+    actions[:, SHELL] = rng.integers(0, len(SHELL_TYPES), n)
+    actions[:, MOVE] = rng.integers(-1, 2, n)
+    return actions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--envs", type=int, default=4096, help="games stepped together")
+    parser.add_argument("--ticks", type=int, default=200, help="steps to time")
+    parser.add_argument("--targets", type=int, default=1, help="num_of_targets of every game")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    env = VecEnv(args.envs, num_of_targets=args.targets, seed=args.seed)
+    env.reset()
+    rng = np.random.default_rng(args.seed)
+    actions = [random_actions(env, rng) for _ in range(min(args.ticks, 64))]
+    total = 0.0
+    start = time.perf_counter()
+    for tick in range(args.ticks):
+        _, reward, _, _, _ = env.step(actions[tick % len(actions)])
+        total += reward.sum()
+    elapsed = time.perf_counter() - start
+    print("{} envs x {} steps in {:.2f} s: {:.0f} env-steps/s, mean reward {:.4f} per step".format(
+        args.envs, args.ticks, elapsed, args.envs * args.ticks / elapsed, total / (args.envs * args.ticks)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())